@@ -0,0 +1,172 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import sys
+import json
+import argparse
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# Exit codes
+OK = 0
+REGRESSION = 1
+NO_BASELINE = 2
+
+
+def machine_profile(results, profile=None):
+    """
+    :param results: Content of a JSON results file of benchmarks.run
+    :param profile: Name of the machine profile. If None, the hostname of the results is used
+    :return: Name of the baseline file of this machine profile and corpus size
+    """
+    return (profile or results['machine']['hostname']) + '-' + results['size'] + '.json'
+
+
+def load(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def variation(baseline, current):
+    """
+    :return: Variation in percent between the two values, None if the baseline is 0
+    """
+    if not baseline:
+        return None
+    return (current - baseline) / baseline * 100
+
+
+def compare(baseline, results, time_threshold=10, memory_threshold=10, min_time=0.01):
+    """
+    Compare the median and the peak RSS of each benchmark with the baseline
+
+    :param baseline: Content of the baseline file
+    :param results: Content of the JSON results file
+    :param time_threshold: Regression allowed on the median, in percent
+    :param memory_threshold: Regression allowed on the peak RSS, in percent
+    :param min_time: Differences of median lower than this (in seconds) are ignored, to avoid the noise of the fastest benchmarks
+    :return: List of rows (dict) with a status : ok, faster, regression, error, new or missing
+    """
+    rows = []
+    for name in sorted(set(baseline['benchmarks']) | set(results['benchmarks'])):
+        before = baseline['benchmarks'].get(name)
+        after = results['benchmarks'].get(name)
+        row = {'name': name, 'before': before, 'after': after, 'time': None, 'memory': None, 'reasons': []}
+        if before is None or before.get('error'):
+            row['status'] = 'new' if after is not None and not after.get('error') else 'error'
+        elif after is None:
+            row['status'] = 'missing'
+        elif after.get('error'):
+            row['status'] = 'regression'
+            row['reasons'].append(after['error'].strip().split('\n')[-1])
+        else:
+            row['time'] = variation(before['median'], after['median'])
+            row['memory'] = variation(before['peak_rss_kb'], after['peak_rss_kb'])
+            if row['time'] is not None and row['time'] > time_threshold and after['median'] - before['median'] >= min_time:
+                row['reasons'].append('median +' + str(round(row['time'], 1)) + '%')
+            if row['memory'] is not None and row['memory'] > memory_threshold:
+                row['reasons'].append('peak RSS +' + str(round(row['memory'], 1)) + '%')
+            if row['reasons']:
+                row['status'] = 'regression'
+            elif row['time'] is not None and row['time'] < -time_threshold:
+                row['status'] = 'faster'
+            else:
+                row['status'] = 'ok'
+        rows.append(row)
+    return rows
+
+
+def table(rows):
+    """
+    :param rows: Result of compare
+    :return: Readable diff table as a string
+    """
+    def fmt(value, pattern):
+        return pattern % value if value is not None else '-'
+
+    lines = ['%-16s %10s %10s %8s %12s %12s %8s  %s' % ('benchmark', 'median', 'baseline', 'diff', 'peak RSS', 'baseline', 'diff', 'status')]
+    for row in rows:
+        before = row['before'] or {}
+        after = row['after'] or {}
+        lines.append('%-16s %10s %10s %8s %12s %12s %8s  %s' % (
+            row['name'],
+            fmt(after.get('median'), '%.3fs'),
+            fmt(before.get('median'), '%.3fs'),
+            fmt(row['time'], '%+.1f%%'),
+            fmt(after.get('peak_rss_kb'), '%d KB'),
+            fmt(before.get('peak_rss_kb'), '%d KB'),
+            fmt(row['memory'], '%+.1f%%'),
+            row['status'].upper() + (' (' + ', '.join(row['reasons']) + ')' if row['reasons'] else '')
+        ))
+    return '\n'.join(lines)
+
+
+def update_baseline(path, results):
+    """
+    Write the results as the new baseline. The benchmarks in error keep their previous baseline
+    """
+    baseline = load(path) if os.path.isfile(path) else {'benchmarks': {}}
+    for name, result in results['benchmarks'].items():
+        if not result.get('error') or name not in baseline['benchmarks']:
+            baseline['benchmarks'][name] = result
+    for key in ('date', 'machine', 'size', 'iterations'):
+        baseline[key] = results[key]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(baseline, file, indent=4)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Compare the results of benchmarks.run with the baseline of the machine')
+    ap.add_argument('results', help="Path to the JSON results of benchmarks.run")
+    ap.add_argument('--profile', required=False, help="Name of the machine profile, default is the hostname of the results")
+    ap.add_argument('--baseline', required=False, help="Path to the baseline, default benchmarks/baselines/<profile>-<size>.json")
+    ap.add_argument('--threshold', type=float, default=10, help="Regression allowed on the median, in percent")
+    ap.add_argument('--memory-threshold', dest='memory_threshold', type=float, default=10, help="Regression allowed on the peak RSS, in percent")
+    ap.add_argument('--min-time', dest='min_time', type=float, default=0.01, help="Differences of median lower than this (in seconds) are ignored")
+    ap.add_argument('--update', required=False, action="store_true", help="Store the results as the new baseline")
+    args = vars(ap.parse_args())
+
+    results = load(args['results'])
+    baseline_path = args['baseline'] or os.path.join(BASELINES_PATH, machine_profile(results, args['profile']))
+
+    if args['update']:
+        update_baseline(baseline_path, results)
+        print('Baseline written into ' + baseline_path)
+        sys.exit(OK)
+
+    if not os.path.isfile(baseline_path):
+        print('No baseline found (' + baseline_path + '), create it with --update')
+        sys.exit(NO_BASELINE)
+
+    baseline = load(baseline_path)
+    if baseline['iterations'] != results['iterations']:
+        print('Warning : baseline done with ' + str(baseline['iterations']) + ' iteration(s), results with ' + str(results['iterations']))
+
+    rows = compare(baseline, results, args['threshold'], args['memory_threshold'], args['min_time'])
+    print('Baseline : ' + baseline_path + ' (' + baseline['date'] + ')')
+    print(table(rows))
+    regressions = [row['name'] for row in rows if row['status'] == 'regression']
+    if regressions:
+        print(str(len(regressions)) + ' regression(s) : ' + ', '.join(regressions))
+        sys.exit(REGRESSION)
+    sys.exit(OK)
+
+
+if __name__ == '__main__':
+    main()
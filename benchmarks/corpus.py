@@ -0,0 +1,192 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import cv2
+import json
+import random
+import textwrap
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import barcode
+    from barcode.writer import ImageWriter
+except ImportError:  # python-barcode is only needed for the C128 corpus (see benchmarks/requirements.txt)
+    barcode = None
+
+DPI = 150
+PAGE_SIZE = (1240, 1754)  # A4 at 150 DPI
+
+MONTHS = ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet', 'août', 'septembre', 'octobre', 'novembre', 'décembre']
+CITIES = ['Paris', 'Lyon', 'Nantes', 'Montpellier', 'Alès', 'Nîmes', 'Toulouse', 'Lille']
+SUBJECTS = [
+    'Candidature pour un emploi de secrétaire',
+    'Demande de subvention pour l\'association sportive',
+    'Réclamation concernant la facture n° 2021-458',
+    'Demande d\'inscription en crèche',
+    'Signalement d\'un nid de poule rue des Lilas',
+    'Demande de permis de construire',
+]
+SENTENCES = [
+    'Madame, Monsieur,',
+    'Je me permets de vous adresser ce courrier afin de porter à votre connaissance la situation suivante.',
+    'Vous trouverez ci-joint les pièces justificatives demandées lors de notre entretien téléphonique.',
+    'Je reste à votre disposition pour tout renseignement complémentaire.',
+    'Dans l\'attente de votre réponse, je vous prie d\'agréer mes salutations distinguées.',
+    'Comme convenu, je vous transmets le dossier complet avant la fin du mois.',
+    'Ce dossier fait suite à notre précédent échange, référencé ci-dessus.',
+]
+
+
+def font(size):
+    for path in ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/usr/share/fonts/dejavu/DejaVuSans.ttf'):
+        if os.path.isfile(path):
+            return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size)
+
+
+def letter_text(rand):
+    """
+    :param rand: random.Random instance, to generate the same corpus at each run
+    :return: Text of a french letter, with a date, a subject and a chrono number
+    """
+    lines = [
+        'M. Jean ' + rand.choice(['Dupont', 'Martin', 'Bernard', 'Petit', 'Durand']),
+        str(rand.randint(1, 120)) + ' rue des ' + rand.choice(['Lilas', 'Écoles', 'Vignes', 'Moulins']),
+        str(rand.randint(10, 95)) + '000 ' + rand.choice(CITIES),
+        '',
+        rand.choice(CITIES) + ', le ' + str(rand.randint(1, 28)) + ' ' + rand.choice(MONTHS) + ' ' + str(rand.randint(2019, 2023)),
+        '',
+        'Objet : ' + rand.choice(SUBJECTS),
+        'Vos réf : 20' + str(rand.randint(19, 23)) + 'A/' + str(rand.randint(10000, 99999)),
+        '',
+    ]
+    lines += [rand.choice(SENTENCES) for _ in range(rand.randint(6, 14))]
+    return '\n'.join(lines)
+
+
+def scanned(img, rand):
+    """
+    Make an image look like a scan : light grey background, noise and a small rotation
+    """
+    pixels = np.asarray(img, dtype=np.int16)
+    noise = np.random.default_rng(rand.randint(0, 2 ** 31)).normal(0, 12, pixels.shape)
+    pixels = np.clip(pixels - 8 + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels).rotate(rand.uniform(-1.2, 1.2), fillcolor=240)
+
+
+def text_page(text, rand):
+    img = Image.new('L', PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(img)
+    _font = font(26)
+    y = 150
+    for paragraph in text.split('\n'):
+        for line in textwrap.wrap(paragraph, 70) or ['']:
+            draw.text((140, y), line, font=_font, fill=0)
+            y += 40
+    return scanned(img, rand)
+
+
+def blank_page(rand):
+    return scanned(Image.new('L', PAGE_SIZE, 255), rand)
+
+
+def qr_page(content, rand):
+    img = Image.new('L', PAGE_SIZE, 255)
+    qr = cv2.QRCodeEncoder.create().encode(content)
+    qr = cv2.resize(qr, (qr.shape[1] * 10, qr.shape[0] * 10), interpolation=cv2.INTER_NEAREST)
+    img.paste(Image.fromarray(qr), ((PAGE_SIZE[0] - qr.shape[1]) // 2, 400))
+    return scanned(img, rand)
+
+
+def c128_page(content, rand):
+    img = Image.new('L', PAGE_SIZE, 255)
+    code = barcode.get('code128', content, writer=ImageWriter()).render({'module_height': 25, 'write_text': False}).convert('L')
+    img.paste(code, ((PAGE_SIZE[0] - code.size[0]) // 2, 400))
+    return scanned(img, rand)
+
+
+def save_pdf(pages, path):
+    pages[0].save(path, 'PDF', resolution=DPI, save_all=True, append_images=pages[1:])
+
+
+def separated_batch(rand, separator_page, with_pj=True):
+    """
+    Pages of a scanned batch : separators followed by letters, attachments (PJSTART) and blank pages
+
+    :param separator_page: Function building a separator page from its content
+    :return: Tuple with the list of pages and the texts of the letters
+    """
+    pages, texts = [], []
+    for destination in rand.sample(['COU', '13', '17', 'DGS', 'PJS'], 3):
+        pages.append(separator_page('MEM_' + destination, rand))
+        for _ in range(rand.randint(1, 3)):
+            texts.append(letter_text(rand))
+            pages.append(text_page(texts[-1], rand))
+        if rand.random() < 0.5:
+            pages.append(blank_page(rand))
+    if with_pj:
+        pages.append(separator_page('PJSTART', rand))
+        pages.append(text_page(letter_text(rand), rand))
+    return pages, texts
+
+
+def generate(path, nb_letters=10, nb_batches=3, nb_mails=10, seed=42):
+    """
+    Generate the synthetic corpus into :path. The same seed gives the same corpus
+
+    :return: Manifest, dict of list of paths by kind (letters, qr_batches, c128_batches, mails, texts)
+    """
+    rand = random.Random(seed)
+    manifest = {'letters': [], 'images': [], 'qr_batches': [], 'c128_batches': [], 'mails': [], 'texts': []}
+    for folder in ('letters', 'batches', 'mails'):
+        os.makedirs(os.path.join(path, folder), exist_ok=True)
+
+    for i in range(nb_letters):
+        text = letter_text(rand)
+        page = text_page(text, rand)
+        manifest['texts'].append(text)
+        manifest['letters'].append(os.path.join(path, 'letters', 'letter_%03d.pdf' % i))
+        manifest['images'].append(os.path.join(path, 'letters', 'letter_%03d.jpg' % i))
+        save_pdf([page], manifest['letters'][-1])
+        page.save(manifest['images'][-1], 'JPEG')
+
+    for i in range(nb_batches):
+        pages, texts = separated_batch(rand, qr_page)
+        manifest['texts'] += texts
+        manifest['qr_batches'].append(os.path.join(path, 'batches', 'qr_%03d.pdf' % i))
+        save_pdf(pages, manifest['qr_batches'][-1])
+        if barcode is not None:
+            pages, _ = separated_batch(rand, c128_page, False)
+            manifest['c128_batches'].append(os.path.join(path, 'batches', 'c128_%03d.pdf' % i))
+            save_pdf(pages, manifest['c128_batches'][-1])
+
+    for i in range(nb_mails):
+        text = letter_text(rand)
+        manifest['texts'].append(text)
+        html = '<html><body>' + ''.join('<p>' + line + '</p>' for line in text.split('\n')) + '</body></html>'
+        manifest['mails'].append(os.path.join(path, 'mails', 'mail_%03d.html' % i))
+        with open(manifest['mails'][-1], 'w', encoding='utf-8') as file:
+            file.write(html)
+        manifest['mails'].append(os.path.join(path, 'mails', 'mail_%03d.txt' % i))
+        with open(manifest['mails'][-1], 'w', encoding='utf-8') as file:
+            file.write(text)
+
+    with open(os.path.join(path, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=4)
+    return manifest
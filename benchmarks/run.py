@@ -0,0 +1,365 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import socket
+import platform
+import argparse
+import tempfile
+import requests
+import statistics
+import traceback
+import multiprocessing
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from benchmarks import corpus
+from PIL import Image
+import src.classes.Log as logClass
+import src.classes.Locale as localeClass
+import src.classes.Images as imagesClass
+import src.classes.Config as configClass
+import src.classes.PyTesseract as ocrClass
+import src.classes.Separator as separatorClass
+import src.classes.WebServices as webserviceClass
+from src.process.FindDate import FindDate
+from src.process.FindSubject import FindSubject
+
+PROJECT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PROCESS = 'OCForMEM_incoming'
+SIZES = {
+    'small': {'nb_letters': 5, 'nb_batches': 2, 'nb_mails': 5},
+    'medium': {'nb_letters': 20, 'nb_batches': 5, 'nb_mails': 20},
+    'large': {'nb_letters': 60, 'nb_batches': 15, 'nb_mails': 60},
+}
+
+
+class StubResponse:
+    status_code = 200
+    text = '{"resId": 1}'
+
+
+class StubRequests:
+    """
+    Replace the requests module used by WebServices : no network, the payloads are built and encoded as usual
+    """
+    exceptions = requests.exceptions
+
+    @staticmethod
+    def get(*args, **kwargs):
+        return StubResponse()
+
+    @staticmethod
+    def post(url, data=None, **kwargs):
+        return StubResponse()
+
+
+def make_config(workdir):
+    """
+    Build a config.ini from the default one, with all the paths into :workdir
+
+    :return: Class Config instance
+    """
+    for folder in ('data/tmp', 'data/error', 'data/log', 'data/exported_pdf', 'data/exported_pdfa', 'separator_tmp'):
+        os.makedirs(os.path.join(workdir, folder), exist_ok=True)
+    with open(os.path.join(PROJECT_PATH, 'src/config/config.ini.default'), 'r') as file:
+        content = file.read()
+    content = content.replace('/opt/mem/opencapture', workdir)
+    content = content.replace('${GLOBAL:projectPath}/src/locale/', PROJECT_PATH + '/src/locale/')
+    content = content.replace('tmpPath             = /tmp/', 'tmpPath             = ' + workdir + '/separator_tmp/')
+    path = os.path.join(workdir, 'config.ini')
+    with open(path, 'w') as file:
+        file.write(content)
+    config = configClass.Config()
+    config.load_file(path)
+    config.cfg['GLOBAL']['spansfile'] = ''
+    return config
+
+
+def copy_files(files, workdir):
+    """
+    Work on copies : the separator and the process move or delete the files they process
+    """
+    folder = tempfile.mkdtemp(dir=workdir)
+    copies = []
+    for file in files:
+        copies.append(os.path.join(folder, os.path.basename(file)))
+        shutil.copy(file, copies[-1])
+    return copies
+
+
+def new_image(context):
+    return imagesClass.Images(tempfile.mktemp(dir=context['config'].cfg['GLOBAL']['tmppath'], suffix='.jpg'), 300, 100, context['log'], context['config'])
+
+
+def bench_separator(context, kind, separation_type):
+    config = context['config']
+    config.cfg['SEPARATOR_QR']['separationtype'] = separation_type
+    for file in copy_files(context['manifest'][kind], context['workdir']):
+        separator = separatorClass.Separator(context['log'], config, tempfile.mkdtemp(dir=config.cfg['GLOBAL']['tmppath']), PROCESS)
+        separator.run(file)
+        if separator.error:
+            raise RuntimeError('Separator error on ' + file + ', see ' + context['log_file'])
+    return len(context['manifest'][kind])
+
+
+def bench_separator_qr(context):
+    return bench_separator(context, 'qr_batches', 'QR_CODE')
+
+
+def bench_separator_c128(context):
+    if not context['manifest']['c128_batches']:
+        raise RuntimeError('python-barcode is not installed, no C128 corpus')
+    return bench_separator(context, 'c128_batches', 'C128')
+
+
+def bench_pdf_to_jpg(context):
+    image = new_image(context)
+    for file in copy_files(context['manifest']['letters'], context['workdir']):
+        if not image.pdf_to_jpg(file):
+            raise RuntimeError('pdf_to_jpg error on ' + file + ', see ' + context['log_file'])
+    return len(context['manifest']['letters'])
+
+
+def bench_text_builder(context):
+    for file in context['manifest']['images']:
+        context['ocr'].text_builder(Image.open(file))
+    return len(context['manifest']['images'])
+
+
+def bench_find_date(context):
+    for text in context['manifest']['texts']:
+        thread = FindDate(text, context['locale'], context['log'], context['config'])
+        thread.start()
+        thread.join()
+    return len(context['manifest']['texts'])
+
+
+def bench_find_subject(context):
+    for text in context['manifest']['texts']:
+        thread = FindSubject(text, context['locale'], context['log'])
+        thread.start()
+        thread.join()
+    return len(context['manifest']['texts'])
+
+
+def bench_html_to_txt(context):
+    image = new_image(context)
+    files = [file for file in context['manifest']['mails'] if file.endswith('.html')]
+    for file in files:
+        image.html_to_txt(file)
+    return len(files)
+
+
+def bench_split_pdf(context):
+    nb_docs = 0
+    for file in context['manifest']['qr_batches']:
+        nb_pages = len(separatorClass.pypdf.PdfReader(file).pages)
+        output = tempfile.mkdtemp(dir=context['workdir'])
+        for start in range(1, nb_pages + 1, 2):
+            separatorClass.split_pdf(file, os.path.join(output, str(start) + '.pdf'), list(range(start, min(start + 2, nb_pages + 1))))
+            nb_docs += 1
+    return nb_docs
+
+
+def bench_insert_payload(context):
+    config = context['config']
+    for file in context['manifest']['letters']:
+        with open(file, 'rb') as pdf:
+            context['web_service'].insert_with_args(pdf.read(), config, 'Objet', '', 'COU', config.cfg[PROCESS])
+    return len(context['manifest']['letters'])
+
+
+def bench_process(context):
+    from src.main import launch
+    resources = {
+        'smtp': False,
+        'config_mail': False,
+        'log': context['log'],
+        'ocr': context['ocr'],
+        'config': context['config'],
+        'locale': context['locale'],
+        'web_service': context['web_service']
+    }
+    inserted = 0
+    for file in copy_files(context['manifest']['letters'], context['workdir']):
+        inserted += launch({'file': file, 'process': 'incoming', 'RDFF': False, 'keep_pdf_debug': 'false', 'destination': None,
+                            'isinternalnote': False, 'resid': None, 'chrono': None}, resources)
+    if inserted != len(context['manifest']['letters']):
+        raise RuntimeError(str(len(context['manifest']['letters']) - inserted) + ' document(s) not inserted, see ' + context['log_file'])
+    return inserted
+
+
+BENCHMARKS = {
+    'separator_qr': (bench_separator_qr, 'batch'),
+    'separator_c128': (bench_separator_c128, 'batch'),
+    'pdf_to_jpg': (bench_pdf_to_jpg, 'page'),
+    'text_builder': (bench_text_builder, 'page'),
+    'find_date': (bench_find_date, 'text'),
+    'find_subject': (bench_find_subject, 'text'),
+    'html_to_txt': (bench_html_to_txt, 'mail'),
+    'split_pdf': (bench_split_pdf, 'document'),
+    'insert_payload': (bench_insert_payload, 'document'),
+    'process': (bench_process, 'document'),
+}
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS of the current process (Linux only), to measure the benchmark and not the setup
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """
+    :return: Peak RSS of the current process, in KB
+    """
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_benchmark(name, manifest, workdir, iterations, output):
+    """
+    Run one benchmark in the current process (a fresh child, see measure). The result is sent to :output
+    """
+    function, unit = BENCHMARKS[name]
+    result = {'unit': unit, 'items': 0, 'times': [], 'error': None}
+    try:
+        webserviceClass.requests = StubRequests
+        config = make_config(workdir)
+        log_file = config.cfg['GLOBAL']['logfile']
+        log = logClass.Log(log_file)
+        locale = localeClass.Locale(config)
+        context = {
+            'log': log,
+            'config': config,
+            'locale': locale,
+            'workdir': workdir,
+            'log_file': log_file,
+            'manifest': manifest,
+            'ocr': ocrClass.PyTesseract(locale.localeOCR, log, config),
+            'web_service': webserviceClass.WebServices('http://localhost/rest/', 'user', 'pwd', log, 30, '')
+        }
+        reset_peak_rss()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            result['items'] = function(context)
+            result['times'].append(round(time.perf_counter() - start, 4))
+    except SystemExit as _e:  # process() exits when a PDF can't be converted
+        result['error'] = 'Exit with code ' + str(_e.code) + ', see ' + config.cfg['GLOBAL']['logfile']
+    except Exception as _e:
+        result['error'] = str(_e) or traceback.format_exc()
+    result['peak_rss_kb'] = peak_rss()
+    output.put(result)
+
+
+def measure(name, manifest, workdir, iterations):
+    """
+    Run a benchmark in its own process, so the peak RSS of a benchmark doesn't hide the others
+    """
+    output = multiprocessing.get_context('fork').Queue()
+    process = multiprocessing.get_context('fork').Process(target=run_benchmark, args=(name, manifest, tempfile.mkdtemp(dir=workdir), iterations, output))
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = output.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                result = {'unit': BENCHMARKS[name][1], 'items': 0, 'times': [], 'error': 'Benchmark process died with exit code ' + str(process.exitcode)}
+    process.join()
+    if result['times']:
+        result['median'] = round(statistics.median(result['times']), 4)
+        result['throughput'] = round(result['items'] / result['median'], 2) if result['median'] else 0
+    return result
+
+
+def machine():
+    return {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmarks of Open-Capture For MEM Courrier on a synthetic corpus')
+    ap.add_argument('--size', choices=SIZES.keys(), default='small', help="Size of the generated corpus")
+    ap.add_argument('--iterations', type=int, default=3, help="Number of runs of each benchmark, the median is kept")
+    ap.add_argument('--only', required=False, help="Comma separated list of benchmarks (" + ','.join(BENCHMARKS) + ")")
+    ap.add_argument('--corpus', required=False, help="Folder of the corpus. Generated if it doesn't contain a manifest.json")
+    ap.add_argument('--output', required=False, help="Path to the JSON results, default benchmarks/results/<hostname>-<date>.json")
+    ap.add_argument('--seed', type=int, default=42)
+    args = vars(ap.parse_args())
+
+    names = args['only'].split(',') if args['only'] else list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit('Unknown benchmark ' + name)
+
+    workdir = tempfile.mkdtemp(prefix='oc_benchmarks_')
+    corpus_path = args['corpus'] or os.path.join(workdir, 'corpus')
+    if os.path.isfile(os.path.join(corpus_path, 'manifest.json')):
+        with open(os.path.join(corpus_path, 'manifest.json'), 'r') as file:
+            manifest = json.load(file)
+    else:
+        print('Generate the ' + args['size'] + ' corpus into ' + corpus_path)
+        manifest = corpus.generate(corpus_path, seed=args['seed'], **SIZES[args['size']])
+
+    results = {
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': machine(),
+        'size': args['size'],
+        'iterations': args['iterations'],
+        'benchmarks': {}
+    }
+    for name in names:
+        result = measure(name, manifest, workdir, args['iterations'])
+        results['benchmarks'][name] = result
+        if result['error']:
+            print('%-16s ERROR %s' % (name, result['error'].strip().split('\n')[-1]))
+        else:
+            print('%-16s %8.3fs median  %8.2f %s(s)/s  %8d KB peak RSS' % (name, result['median'], result['throughput'], result['unit'], result['peak_rss_kb']))
+
+    output = args['output'] or os.path.join(PROJECT_PATH, 'benchmarks/results', results['machine']['hostname'] + '-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=4)
+    print('Results written into ' + output)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,7 +18,13 @@
 import os
 import sys
 import argparse
-from src.main import launch
+import src.classes.Log as logClass
+from src.classes.Daemon import Daemon
+from src.classes.Batch import Batch, list_batch_files
+import src.classes.Config as configClass
+import src.classes.Metrics as metricsClass
+from src.classes.Profiler import ProfiledLaunch, PROFILE_MODES
+from src.main import launch, launch_task, launch_pipeline, init_resources
 
 # construct the argument parse and parse the arguments
 ap = argparse.ArgumentParser()
@@ -31,12 +37,60 @@ ap.add_argument('-process', "--process", required=False, default='incoming')
 ap.add_argument('-kpdfd', "--keep-pdf-debug", required=False, default='false')
 ap.add_argument("-d", '--destination', required=False, help="Default destination")
 ap.add_argument("--read-destination-from-filename", '--RDFF', dest='RDFF', action="store_true", required=False, help="Read destination from filename")
+ap.add_argument('--daemon', required=False, action="store_true", help="Stay resident and process the files of the watched folder")
+ap.add_argument('--watch', required=False, help="Folder watched by the daemon mode")
+ap.add_argument('--interval', required=False, type=float, help="Delay in seconds between two scans of the watched folder")
+ap.add_argument('--workers', required=False, type=int, help="Number of files processed at the same time by the daemon")
+ap.add_argument('--batch', required=False, help="Process all the files of a folder, a glob pattern or a text file listing the files")
+ap.add_argument('--jobs', required=False, type=int, default=1, help="Number of files processed at the same time in batch mode")
+ap.add_argument('--pipeline', required=False, action="store_true", help="In batch mode, run the rasterise, OCR, extract and upload steps of different files at the same time")
+ap.add_argument('--enqueue', required=False, action="store_true", help="Send the file to the RabbitMQ queue instead of processing it")
+ap.add_argument('--profile', required=False, nargs='?', const='cpu', choices=PROFILE_MODES, help="Write a cProfile (cpu) or tracemalloc (alloc) profile of each document into data/log/profiles")
 args = vars(ap.parse_args())
 
+if not os.path.exists(args['config']):
+    sys.exit('Config file couldn\'t be found')
+
+if args['profile'] and args['pipeline']:
+    sys.exit('--profile can\'t be used with --pipeline, the steps of many files run at the same time and a profile is written for each file')
+
+if args['profile']:
+    profile_config = configClass.Config()
+    profile_config.load_file(args['config'])
+    launch = ProfiledLaunch(launch, args['profile'], os.path.dirname(profile_config.cfg['GLOBAL']['logfile']) + '/profiles/')
+
+if args['daemon']:
+    if args['watch'] is None or not os.path.isdir(args['watch']):
+        sys.exit('Watched folder couldn\'t be found')
+    config = configClass.Config()
+    config.load_file(args['config'])
+    log = logClass.Log(config.cfg['GLOBAL']['logfile'])
+    metricsClass.configure(config)
+    metricsClass.start_http_server(config, log)
+    Daemon(args['watch'], args, launch, init_resources, config, log).run()
+    sys.exit(0)
+
+if args['batch']:
+    config = configClass.Config()
+    config.load_file(args['config'])
+    files = list_batch_files(args['batch'])
+    if not files:
+        sys.exit('No file found for batch ' + args['batch'])
+    log = logClass.Log(config.cfg['GLOBAL']['logfile'])
+    metricsClass.configure(config)
+    metricsClass.start_http_server(config, log)
+    batch = Batch(files, args, launch, init_resources, log, args['jobs'], launch_pipeline if args['pipeline'] else None)
+    batch.run()
+    report = batch.summary()
+    batch.Log.info(report)
+    print(report)
+    sys.exit(0 if all(result['inserted'] for result in batch.results) else 1)
+
 if args['file'] is None:
     sys.exit('No file was given')
 
-if not os.path.exists(args['config']):
-    sys.exit('Config file couldn\'t be found')
+if args['enqueue']:
+    launch_task.send_to_queue(args=(args,))
+    sys.exit(0)
 
 launch(args)
@@ -20,12 +20,14 @@ import sys
 import argparse
 import tempfile
 import datetime
-from src.main import launch
+from src.main import launch, launch_task, init_resources
 from src.classes.SMTP import SMTP
 import src.classes.Log as logClass
 import src.classes.Mail as mailClass
 import src.classes.Config as configClass
+import src.classes.Metrics as metricsClass
 import src.classes.WebServices as webserviceClass
+from src.classes.Profiler import ProfiledLaunch, PROFILE_MODES
 
 
 def str2bool(value):
@@ -56,11 +58,27 @@ def check_folders(folder_crawl, folder_dest=False):
         return True
 
 
+def launch_or_enqueue(launch_args, enqueue, resources):
+    """
+    Process the e-mail, or send it to the RabbitMQ queue to be processed by the queue workers
+
+    :param launch_args: Arguments of the launch function
+    :param enqueue: Boolean, if True send the e-mail to the queue
+    :param resources: Shared classes instances of the batch (None if enqueue is True)
+    """
+    if enqueue:
+        launch_task.send_to_queue(args=(launch_args,))
+    else:
+        launch(launch_args, resources)
+
+
 # construct the argument parse and parse the arguments
 ap = argparse.ArgumentParser()
 ap.add_argument("-c", "--config", required=True, help="path to config.ini")
 ap.add_argument("-cm", "--config_mail", required=True, help="path to mail.ini")
 ap.add_argument('-p', "--process", required=True, default='MAIL_1')
+ap.add_argument('--enqueue', required=False, action="store_true", help="Send the e-mails to the RabbitMQ queue instead of processing them")
+ap.add_argument('--profile', required=False, nargs='?', const='cpu', choices=PROFILE_MODES, help="Write a cProfile (cpu) or tracemalloc (alloc) profile of each e-mail into the batch folder")
 args = vars(ap.parse_args())
 
 if not os.path.exists(args['config']) or not os.path.exists(args['config_mail']):
@@ -71,6 +89,7 @@ print('Start process : ' + process)
 
 config = configClass.Config()
 config.load_file(args['config'])
+metricsClass.configure(config)
 
 config_mail = configClass.Config()
 config_mail.load_file(args['config_mail'])
@@ -169,14 +188,28 @@ if check:
         Log.info('Import only attachments is : ' + str(import_only_attachments))
         Log.info('Action after processing e-mail is : ' + action)
         Log.info('Number of e-mail to process : ' + str(len(emails)))
+        if args['profile'] and not args['enqueue']:
+            launch = ProfiledLaunch(launch, args['profile'], batch_path + '/profiles/')
+        # Load Config, Locale, PyTesseract and WebServices once for the whole batch
+        resources = None
+        if not args['enqueue']:
+            resources = init_resources({
+                'isMail': True,
+                'config': args['config'],
+                'config_mail': args['config_mail'],
+                'log': batch_path + '/' + date_batch + '.log'
+            })
+
         i = 1
         for msg in emails:
+            metricsClass.set_gauge('opencapture_backlog', len(emails) - i + 1, source=process)
+            metricsClass.flush()
             # Backup all the e-mail into batch path
             Mail.backup_email(msg, batch_path, force_utf8)
             ret, file = Mail.construct_dict_before_send_to_mem(msg, config_mail.cfg[process], batch_path, Log)
             _from = ret['mail']['from']
             if not import_only_attachments:
-                launch({
+                launch_or_enqueue({
                     'cpt': str(i),
                     'file': file,
                     'from': _from,
@@ -197,7 +230,7 @@ if check:
                     'priority_mail_date': priority_mail_date,
                     'priority_mail_from': priority_mail_from,
                     'error_path': path_without_time + '/_ERROR/' + process + '/' + year + month + day
-                })
+                }, args['enqueue'], resources)
             else:
                 Log.info('Start to process only attachments')
                 if len(ret['attachments']) > 0:
@@ -205,7 +238,7 @@ if check:
                     cpt = 1
                     for attachment in ret['attachments']:
                         if attachment['format'].lower() == 'pdf':
-                            launch({
+                            launch_or_enqueue({
                                 'isMail': 'attachments',
                                 'data': ret['mail'],
                                 'from': _from,
@@ -218,7 +251,7 @@ if check:
                                 'priority_mail_from': priority_mail_from,
                                 'priority_mail_subject': priority_mail_subject,
                                 'log': batch_path + '/' + date_batch + '.log'
-                            })
+                            }, args['enqueue'], resources)
                         else:
                             Log.error('Attachment n°' + str(cpt) + ' is not a pdf file')
                         cpt += 1
@@ -236,6 +269,7 @@ if check:
                 Log.info('Move mail to trash')
                 Mail.delete_mail(msg, folder_trash, Log)
             i = i + 1
+        metricsClass.set_gauge('opencapture_backlog', 0, source=process)
     else:
         sys.exit('Folder do not contain any e-mail. Exit...')
 else:
@@ -0,0 +1,71 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import sys
+import time
+import argparse
+from src.main import OCForMEM, QUEUE, rabbitMQData, launch_task
+import src.classes.Log as logClass
+import src.classes.Config as configClass
+import src.classes.Metrics as metricsClass
+import src.classes.PageCache as pageCacheClass
+from src.classes.TaskQueue import LocalBroker, run_workers, run_kuyruk_worker
+
+# construct the argument parse and parse the arguments
+ap = argparse.ArgumentParser()
+ap.add_argument('--workers', required=False, type=int, default=rabbitMQData.get('nbWorkers', 1), help="Number of worker processes")
+ap.add_argument('--prefetch', required=False, type=int, default=rabbitMQData.get('prefetch', 1), help="Number of messages sent by RabbitMQ to each worker in advance")
+ap.add_argument('--concurrency', required=False, type=int, default=rabbitMQData.get('concurrency', 1), help="Number of tasks run at the same time by each worker")
+ap.add_argument('--local', required=False, help="Process all the files of this folder without RabbitMQ (load tests)")
+ap.add_argument("-c", "--config", required=False, help="path to config.ini, needed with --local or to serve the metrics")
+ap.add_argument('-process', "--process", required=False, default='incoming')
+ap.add_argument("--read-destination-from-filename", '--RDFF', dest='RDFF', action="store_true", required=False, help="Read destination from filename")
+args = vars(ap.parse_args())
+pageCacheClass.set_processes(args['workers'])
+
+if args['config'] is not None and os.path.exists(args['config']):
+    config = configClass.Config()
+    config.load_file(args['config'])
+    metricsClass.configure(config)
+    metricsClass.start_http_server(config, logClass.Log(config.cfg['GLOBAL']['logfile']))
+
+if args['local'] is None:
+    print('Start ' + str(args['workers']) + ' worker(s) on queue ' + QUEUE)
+    run_workers(args['workers'], run_kuyruk_worker, OCForMEM, [QUEUE], args['prefetch'], args['concurrency'])
+    sys.exit(0)
+
+if args['config'] is None or not os.path.exists(args['config']):
+    sys.exit('Config file couldn\'t be found')
+
+broker = LocalBroker()
+files = sorted(os.listdir(args['local']))
+for file in files:
+    broker.send_to_queue(launch_task, ({
+        'file': os.path.join(args['local'], file),
+        'config': args['config'],
+        'process': args['process'],
+        'RDFF': args['RDFF'],
+        'keep_pdf_debug': 'false'
+    },))
+broker.close(args['workers'] * args['concurrency'])
+
+start = time.time()
+run_workers(args['workers'], broker.run_worker, args['concurrency'])
+duration = time.time() - start
+print(str(len(files)) + ' file(s) processed in ' + str(round(duration, 2)) + 's with ' + str(args['workers']) + ' worker(s) of concurrency ' +
+      str(args['concurrency']) + ' : ' + str(round(len(files) / duration, 2) if duration else 0) + ' file(s)/s')
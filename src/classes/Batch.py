@@ -0,0 +1,114 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import glob
+import time
+import multiprocessing
+import src.classes.Daemon as daemonClass
+import src.classes.Metrics as metricsClass
+from . import PageCache
+from .Watcher import EXTENSIONS_ALLOWED
+
+
+def list_batch_files(batch):
+    """
+    Build the list of files to process
+
+    :param batch: Folder, glob pattern (e.g : /archives/2019/*.pdf) or text file containing one path per line
+    :return: List of paths
+    """
+    if os.path.isdir(batch):
+        files = [os.path.join(batch, file) for file in sorted(os.listdir(batch))]
+        return [file for file in files if os.path.isfile(file) and os.path.splitext(file)[1].lower() in EXTENSIONS_ALLOWED]
+    if os.path.isfile(batch) and os.path.splitext(batch)[1].lower() not in EXTENSIONS_ALLOWED:
+        with open(batch, 'r') as list_file:
+            return [line.strip() for line in list_file if line.strip()]
+    return sorted(glob.glob(batch))
+
+
+class Batch:
+    def __init__(self, files, args, launch, init_resources, log, jobs=1, pipeline=None):
+        self.Log = log
+        self.args = args
+        self.files = files
+        self.results = []
+        self.duration = 0
+        self.launch = launch
+        self.jobs = max(1, jobs)
+        self.pipeline = pipeline
+        self.init_resources = init_resources
+
+    def run(self):
+        """
+        Process all the files, one at a time with shared classes instances, :jobs at a time in a pool of processes
+        or through the stages of :pipeline (see main.launch_pipeline). An error on a file is logged and doesn't stop the batch
+
+        :return: List of results (see Daemon.process_in_worker)
+        """
+        start = time.time()
+        if self.pipeline is not None:
+            self.Log.info('Start batch of ' + str(len(self.files)) + ' file(s) in pipeline mode')
+            for result in self.pipeline(self.files, self.args, self.init_resources(self.args)):
+                self.add_result(result)
+            self.duration = time.time() - start
+            return self.results
+
+        self.Log.info('Start batch of ' + str(len(self.files)) + ' file(s) with ' + str(self.jobs) + ' job(s)')
+        if self.jobs == 1:
+            daemonClass.worker_resources = self.init_resources(self.args)
+            for file in self.files:
+                self.add_result(daemonClass.process_in_worker(self.launch, self.args, file))
+        else:
+            PageCache.set_processes(self.jobs)
+            with multiprocessing.Pool(self.jobs, daemonClass.init_worker, (self.init_resources, self.args)) as pool:
+                for result in pool.imap_unordered(process_file, [(self.launch, self.args, file) for file in self.files]):
+                    self.add_result(result)
+        self.duration = time.time() - start
+        return self.results
+
+    def add_result(self, result):
+        self.results.append(result)
+        metricsClass.set_gauge('opencapture_backlog', len(self.files) - len(self.results), source='batch')
+        metricsClass.flush()
+        if result['error'] is not None:
+            self.Log.error('Error while processing ' + result['path'] + ' : ' + result['error'])
+
+    def summary(self):
+        """
+        :return: Report of the batch, as a string
+        """
+        inserted = [result for result in self.results if result['inserted']]
+        failed = [result for result in self.results if not result['inserted']]
+        durations = sorted(result['duration'] for result in self.results)
+        report = [
+            'Batch report',
+            '  Files        : ' + str(len(self.results)),
+            '  Inserted     : ' + str(len(inserted)),
+            '  Failed       : ' + str(len(failed)),
+            '  Duration     : ' + str(round(self.duration, 2)) + 's',
+        ]
+        if durations:
+            report.append('  Per file     : ' + str(round(sum(durations) / len(durations), 2)) + 's average, ' + str(round(durations[-1], 2)) + 's max')
+            report.append('  Throughput   : ' + str(round(len(durations) / self.duration * 60, 2)) + ' file(s)/min')
+        for result in failed:
+            report.append('  FAILED ' + result['path'] + (' : ' + result['error'] if result['error'] else ''))
+        return '\n'.join(report)
+
+
+def process_file(task):
+    return daemonClass.process_in_worker(*task)
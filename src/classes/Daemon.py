@@ -0,0 +1,166 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import time
+import shutil
+import signal
+import threading
+import multiprocessing
+from . import Metrics
+from . import PageCache
+from .Watcher import Watcher, acquire_lease, release_lease
+
+# Shared classes instances of a pool worker process, built once by init_worker
+worker_resources = None
+
+
+def init_worker(init_resources, args):
+    global worker_resources
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Only the daemon handle the stop signal
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    worker_resources = init_resources(args)
+
+
+def process_in_worker(launch, args, path):
+    """
+    Process one file inside a pool worker process
+
+    :return: Dict with the path, the error message if any, the result of launch and the duration
+    """
+    args = dict(args)
+    args['file'] = path
+    result = {'path': path, 'error': None, 'inserted': False}
+    start = time.time()
+    try:
+        result['inserted'] = launch(args, worker_resources)
+    except (Exception, SystemExit) as _e:  # One bad file must not stop the worker
+        result['error'] = str(_e)
+    result['duration'] = time.time() - start
+    return result
+
+
+class Daemon:
+    def __init__(self, watch, args, launch, init_resources, config, log):
+        self.args = args
+        self.Log = log
+        self.watch = watch
+        self.pool = None
+        self.launch = launch
+        self.running = False
+        self.in_flight = set()
+        self.init_resources = init_resources
+        self.lock = threading.Lock()
+        self.error_path = config.cfg['GLOBAL']['errorpath']
+
+        daemon_cfg = config.cfg.get('DAEMON', {})
+        self.interval = float(args.get('interval') or daemon_cfg.get('interval', 2))
+        self.workers = int(args.get('workers') or daemon_cfg.get('nbworkers', 1))
+        self.lease_path = daemon_cfg.get('leasepath', config.cfg['GLOBAL']['tmppath'] + '/leases/')
+        self.done_path = daemon_cfg.get('donepath', config.cfg['GLOBAL']['projectpath'] + '/data/done/')
+        # Bound the number of files sent to the pool, the others stay in the watched folder
+        self.slots = threading.BoundedSemaphore(self.workers * 2)
+        self.watcher = Watcher(watch, log, self.interval, daemon_cfg.get('watchmode', 'inotify'))
+        os.makedirs(self.lease_path, exist_ok=True)
+        os.makedirs(self.done_path, exist_ok=True)
+
+    def stop(self, signum=None, frame=None):
+        """
+        Stop the daemon after the end of the current files (SIGTERM or SIGINT handler)
+        """
+        self.Log.info('Stop signal received, the daemon will stop after the current files')
+        self.running = False
+
+    def move_to_error(self, path):
+        self.move(path, self.error_path)  # Avoid to process the same broken file again and again
+
+    def move(self, path, folder):
+        if os.path.isfile(path):
+            try:
+                shutil.move(path, os.path.join(folder, os.path.basename(path)))
+            except (shutil.Error, OSError) as _e:
+                self.Log.error('Moving file ' + path + ' error : ' + str(_e))
+
+    def done(self, result):
+        """
+        Called when a file is processed, in the daemon process
+
+        :param result: Dict returned by process_in_worker
+        """
+        path = result['path']
+        if result['error'] is not None:
+            self.Log.error('Error while processing ' + path + ' : ' + result['error'])
+            self.move_to_error(path)
+        elif os.path.isfile(path):  # Kept by the process (keep_pdf_debug, rejected or not inserted file), the rescan would send it again
+            folder = self.done_path if result.get('inserted') else self.error_path
+            self.Log.info('File ' + path + ' still in the watched folder after its processing (' +
+                          ('inserted' if result.get('inserted') else 'not inserted') + '), moved to ' + folder)
+            self.move(path, folder)
+        release_lease(self.lease_path, path)
+        with self.lock:
+            self.in_flight.discard(path)
+        self.slots.release()
+
+    def dispatch(self, path):
+        """
+        Send a file to the worker pool, or process it directly if there is only one worker
+
+        :param path: Path to the file
+        """
+        with self.lock:
+            if path in self.in_flight or not os.path.isfile(path):
+                return
+            if not acquire_lease(self.lease_path, path):  # Already processed by a worker of another daemon
+                return
+            self.in_flight.add(path)
+
+        self.slots.acquire()
+        if self.pool is None:
+            self.done(process_in_worker(self.launch, self.args, path))
+        else:
+            self.pool.apply_async(process_in_worker, (self.launch, self.args, path), callback=self.done,
+                                  error_callback=lambda _e, _path=path: self.done({'path': _path, 'error': str(_e)}))
+
+    def run(self):
+        """
+        Main loop of the daemon. Watch the folder and process files until a stop signal is received
+        """
+        global worker_resources
+        if self.workers > 1:
+            PageCache.set_processes(self.workers)
+            self.pool = multiprocessing.Pool(self.workers, init_worker, (self.init_resources, self.args))
+        else:
+            worker_resources = self.init_resources(self.args)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.running = True
+        self.Log.info('Daemon started with ' + str(self.workers) + ' worker(s), watching ' + self.watch + ' (' + self.watcher.mode + ')')
+        while self.running:
+            for path in self.watcher.poll():
+                if not self.running:
+                    break
+                self.dispatch(path)
+            Metrics.set_gauge('opencapture_backlog', self.watcher.backlog(), source=self.watch)
+            Metrics.flush()
+
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.watcher.close()
+        self.Log.info('Daemon stopped')
@@ -16,12 +16,14 @@
 # @dev : Nathan Cheval <nathan.cheval@outlook.fr>
 
 import os
-import time
 import shutil
 import pypdf
 from PIL import Image
 from bs4 import BeautifulSoup
 from pdf2image import convert_from_path
+from . import Metrics
+from . import Readiness
+from .Spans import timed
 
 
 class Images:
@@ -31,8 +33,10 @@ class Images:
         self.resolution = res
         self.compressionQuality = quality
         self.img = None
+        self.page_cache = None  # Class PageCache instance of the document, if set the pages are rendered only once
         self.log = log
         self.config = config.cfg
+        self.grayscale = self.config['GLOBAL'].get('grayscale') == 'True'
 
     def html_to_txt(self, html_name):
         """
@@ -57,18 +61,21 @@ class Images:
         minutes, seconds = divmod(rem, 60)
         return "{:0>2}:{:0>2}:{:05.2f}".format(int(hours), int(minutes), seconds)
 
+    @timed('pdf_to_jpg')
     def pdf_to_jpg(self, pdf_name, open_img=True):
         """
-        Convert the first page of PDF to JPG and open the image
+        Render the first page of PDF in memory and store the image in class var. No JPG is written, unless open_img is False
 
         :param pdf_name: Path to the pdf
-        :param open_img: Boolean to open image and store it in class var
+        :param open_img: Boolean to store the image in class var. If False, the page is saved into the JPG file
         :return: Boolean to show if all the processes ended well
         """
-        res = self.save_img_with_pdf2image(pdf_name, self.jpg_name, 1)
-        if res is not False:
-            if open_img:
-                self.img = Image.open(self.jpg_name)
+        if open_img:
+            img = self.render_page(pdf_name, 1)
+            if img is not None:
+                self.img = img
+                return True
+        elif self.save_img_with_pdf2image(pdf_name, self.jpg_name, 1) is not False:
             return True
         try:
             shutil.move(pdf_name, self.config['GLOBAL']['errorpath'])
@@ -76,16 +83,70 @@ class Images:
             self.log.error('Moving file ' + pdf_name + ' error : ' + str(_e))
         return False
 
+    def render_page(self, pdf_name, page=1, dpi=None, grayscale=None, roi=None):
+        """
+        Render a page of PDF in memory, without JPG encoding
+
+        :param pdf_name: Path to the pdf
+        :param page: Number of the page, starting at 1
+        :param dpi: Resolution of the rendering. If None, the resolution of the config is used
+        :param grayscale: Boolean to render in grayscale. If None, the grayscale option of the config is used
+        :param roi: Tuple (left, top, right, bottom) of the area to keep, in fraction of the page (0 to 1). If None, the full page is kept
+        :return: PIL Image, or None if the page couldn't be rendered
+        """
+        dpi = dpi or self.resolution
+        grayscale = self.grayscale if grayscale is None else grayscale
+        try:
+            if self.page_cache is not None:
+                img = self.page_cache.get(pdf_name, page, dpi, grayscale)
+            else:
+                images = convert_from_path(pdf_name, first_page=page, last_page=page, dpi=dpi, grayscale=grayscale)
+                Metrics.inc('opencapture_pages_rasterised_total', len(images))
+                img = images[0] if images else None
+        except Exception as error:
+            self.log.error('Error during pdf2image conversion : ' + str(error))
+            return None
+        if img is None:
+            self.log.error('Error during pdf2image conversion : page ' + str(page) + ' not found in ' + pdf_name)
+            return None
+        if roi is not None:
+            return self.crop(img, roi)
+        return img
+
+    @staticmethod
+    def crop(img, roi):
+        """
+        :param img: PIL Image
+        :param roi: Tuple (left, top, right, bottom) in fraction of the image (0 to 1)
+        :return: Cropped PIL Image
+        """
+        width, height = img.size
+        return img.crop((int(roi[0] * width), int(roi[1] * height), int(roi[2] * width), int(roi[3] * height)))
+
+    @staticmethod
+    def downscale(img, dpi, target_dpi):
+        """
+        :param img: PIL Image
+        :param dpi: Resolution of :img
+        :param target_dpi: Resolution wanted, lower than :dpi
+        :return: Resized PIL Image, with its new resolution in its info
+        """
+        ratio = target_dpi / dpi
+        img = img.resize((round(img.size[0] * ratio), round(img.size[1] * ratio)), Image.BILINEAR, reducing_gap=2.0)
+        img.info['dpi'] = (target_dpi, target_dpi)
+        return img
+
     def save_img_with_pdf2image(self, pdf_name, output, page=None):
         try:
             output = os.path.splitext(output)[0]
             bck_output = os.path.splitext(output)[0]
-            images = convert_from_path(pdf_name, first_page=page, last_page=page, dpi=400)
+            images = convert_from_path(pdf_name, first_page=page, last_page=page, dpi=self.resolution, grayscale=self.grayscale)
+            Metrics.inc('opencapture_pages_rasterised_total', len(images))
             cpt = 1
             for i in range(len(images)):
                 if not page:
                     output = bck_output + '-' + str(cpt).zfill(3)
-                images[i].save(output + '.jpg', 'JPEG')
+                images[i].save(output + '.jpg', 'JPEG', quality=self.compressionQuality)
                 cpt = cpt + 1
             return True
         except Exception as error:
@@ -100,45 +161,38 @@ class Images:
         """
         self.img = Image.open(img)
 
-    def check_file_integrity(self, file, config):
+    @timed('integrity_check')
+    def check_file_integrity(self, file, config, wait=True):
         """
         Check if file is not corrupted
 
         :param file: Path to file
         :param config: Class Config instance
+        :param wait: Boolean to wait until the file is completely written (to avoid process truncate file while files was send over network).
+                     False for the files written by Open-Capture itself (e-mails, separated documents)
         :return: Boolean to show if all the processes ended well
         """
-        is_full = False
-        count = 0
-        while not is_full and count < 5:
-            try:
-                with open(file, 'rb') as doc:
-                    # size and size2 allow to check if file is full (to avoid process truncate file while files was send over network)
-                    size = os.path.getsize(file)
-                    time.sleep(1)
-                    size2 = os.path.getsize(file)
-                    if size2 == size:
-                        if file.lower().endswith(".pdf"):
-                            try:
-                                pypdf.PdfReader(doc, strict=False)
-                            except pypdf.utils.PdfReadError:
-                                shutil.move(file, config.cfg['GLOBAL']['errorpath'] + os.path.basename(file))
-                                return False
-                            return True
-                        elif file.lower().endswith('.html') or file.lower().endswith('.txt'):
-                            return True
-                        elif file.lower().endswith('.jpg'):
-                            try:
-                                Image.open(file)
-                            except OSError:
-                                return False
-                            return True
-                        else:
-                            return False
-                    else:
-                        count = count + 1
-                        continue
-            except PermissionError as e:
-                self.log.error(e)
+        try:
+            if wait and not Readiness.wait_until_ready(file, int(config.cfg['GLOBAL'].get('filereadytimeout') or 10)):
                 return False
-        return False
+            with open(file, 'rb') as doc:
+                if file.lower().endswith(".pdf"):
+                    try:
+                        pypdf.PdfReader(doc, strict=False)
+                    except pypdf.errors.PdfReadError:
+                        shutil.move(file, config.cfg['GLOBAL']['errorpath'] + os.path.basename(file))
+                        return False
+                    return True
+                elif file.lower().endswith('.html') or file.lower().endswith('.txt'):
+                    return True
+                elif file.lower().endswith('.jpg'):
+                    try:
+                        Image.open(file)
+                    except OSError:
+                        return False
+                    return True
+                else:
+                    return False
+        except PermissionError as e:
+            self.log.error(e)
+            return False
@@ -40,8 +40,12 @@ class RotatingFileHandlerUmask(logging.handlers.RotatingFileHandler):
 
 
 class Log:
-    def __init__(self, path):
-        self.LOGGER = logging.getLogger('Open-Capture')
+    def __init__(self, path, name='Open-Capture'):
+        """
+        :param path: Path to the log file
+        :param name: Name of the logger. The tasks running at the same time on a queue worker each use their own one
+        """
+        self.LOGGER = logging.getLogger(name)
         if self.LOGGER.hasHandlers():
             self.LOGGER.handlers.clear()  # Clear the handlers to avoid double logs
         log_file = RotatingFileHandlerUmask(path, mode='a', maxBytes=5 * 1024 * 1024, backupCount=2)
@@ -54,6 +58,11 @@ class Log:
         self.LOGGER.addFilter(self._filter)
         self.LOGGER.setLevel(logging.DEBUG)
 
+    def close(self):
+        for handler in list(self.LOGGER.handlers):
+            self.LOGGER.removeHandler(handler)
+            handler.close()
+
     @caller_reader
     def info(self, msg):
         self.LOGGER.info(msg)
@@ -0,0 +1,212 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import json
+import fcntl
+import atexit
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from . import Spans
+
+# Name, type and help of each metric, in Prometheus text format
+METRICS = {
+    'opencapture_documents_processed_total': ('counter', 'Documents inserted into MEM Courrier, by process'),
+    'opencapture_documents_failed_total': ('counter', 'Documents not inserted into MEM Courrier, by process'),
+    'opencapture_bytes_uploaded_total': ('counter', 'Bytes of documents sent to MEM Courrier, by WebServices endpoint'),
+    'opencapture_pages_rasterised_total': ('counter', 'PDF pages converted to image'),
+    'opencapture_ocr_pages_total': ('counter', 'Images read by tesseract'),
+    'opencapture_ocr_tier_total': ('counter', 'First pages OCRised by tier (fast or full resolution) and reason of the full resolution OCR'),
+    'opencapture_webservice_duration_seconds': ('histogram', 'Duration of the WebServices calls, by endpoint'),
+    'opencapture_backlog': ('gauge', 'Files waiting in the watched folder or e-mails waiting in the current batch'),
+}
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}  # Increments since the last flush
+_gauges = {}
+_state_file = None
+_text_file = None
+
+
+def reset():
+    global _counters, _gauges
+    _counters, _gauges = {}, {}
+
+
+# A forked worker must not flush again the increments of its parent
+os.register_at_fork(after_in_child=reset)
+
+
+def series(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in sorted(labels.items())) + '}'
+
+
+def configure(config):
+    """
+    Enable the metrics if the METRICS section of the config is active. The counters of all the processes (workers, launch scripts...)
+    are added up into the same state file
+
+    :param config: Class Config instance
+    """
+    global _state_file, _text_file
+    metrics_cfg = config.cfg.get('METRICS', {})
+    if metrics_cfg.get('enabled') != 'True' or _state_file is not None:
+        return
+    _state_file = metrics_cfg['statefile']
+    _text_file = metrics_cfg.get('textfile') or None
+    Spans.listeners.append(on_span)
+    atexit.register(flush)
+
+
+def on_span(name, wall):
+    if name.startswith('ws_'):
+        observe('opencapture_webservice_duration_seconds', wall, endpoint=name[3:])
+    elif name == 'text_builder':
+        inc('opencapture_ocr_pages_total')
+
+
+def inc(name, value=1, **labels):
+    if _state_file is None:
+        return
+    key = series(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    if _state_file is None:
+        return
+    for bucket in BUCKETS:
+        if value <= bucket:
+            inc(name + '_bucket', le=str(bucket), **labels)
+    inc(name + '_bucket', le='+Inf', **labels)
+    inc(name + '_sum', value, **labels)
+    inc(name + '_count', **labels)
+
+
+def set_gauge(name, value, **labels):
+    if _state_file is None:
+        return
+    with _lock:
+        _gauges[series(name, labels)] = value
+
+
+def document_done(process, inserted):
+    inc('opencapture_documents_processed_total' if inserted else 'opencapture_documents_failed_total', process=process)
+    flush()
+
+
+def flush():
+    """
+    Add the increments of this process to the state file, then write the textfile if needed
+    """
+    global _counters, _gauges
+    if _state_file is None:
+        return
+    with _lock:
+        counters, gauges = _counters, _gauges
+        _counters, _gauges = {}, {}
+
+    fd = os.open(_state_file, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        content = b''
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            content += chunk
+        state = json.loads(content) if content else {'counters': {}, 'gauges': {}}
+        for key, value in counters.items():
+            state['counters'][key] = state['counters'].get(key, 0) + value
+        state['gauges'].update(gauges)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps(state).encode('utf-8'))
+    finally:
+        os.close(fd)  # Release the lock
+
+    if _text_file:
+        tmp_file = _text_file + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp_file, 'w') as file:
+            file.write(render(state))
+        os.replace(tmp_file, _text_file)  # node_exporter must never read a partial file
+
+
+def render(state=None):
+    """
+    :param state: Content of the state file. If None, the file is read
+    :return: All the metrics in Prometheus text format
+    """
+    if state is None:
+        try:
+            with open(_state_file, 'r') as file:
+                fcntl.flock(file, fcntl.LOCK_SH)
+                content = file.read()
+            state = json.loads(content) if content else {}
+        except (TypeError, FileNotFoundError):
+            state = {}
+
+    values = dict(state.get('counters', {}))
+    values.update(state.get('gauges', {}))
+    lines = []
+    for name, (_type, _help) in METRICS.items():
+        lines.append('# HELP ' + name + ' ' + _help)
+        lines.append('# TYPE ' + name + ' ' + _type)
+        for key in sorted(values):
+            if key.split('{')[0] in (name, name + '_bucket', name + '_sum', name + '_count'):
+                lines.append(key + ' ' + str(values[key]))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        flush()
+        content = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, _format, *args):
+        pass
+
+
+def start_http_server(config, log):
+    """
+    Serve /metrics on the port set in the METRICS section, in a background thread. Only one process should call it
+
+    :return: HTTP server instance, or None if the port isn't set or the metrics are disabled
+    """
+    port = int(config.cfg.get('METRICS', {}).get('port') or 0)
+    if _state_file is None or port == 0:
+        return None
+    try:
+        server = ThreadingHTTPServer(('', port), MetricsHandler)
+    except OSError as _e:
+        log.error('Unable to start the metrics server on port ' + str(port) + ' : ' + str(_e))
+        return None
+    threading.Thread(target=server.serve_forever, name='metricsThread', daemon=True).start()
+    log.info('Metrics served on port ' + str(port) + ' (/metrics)')
+    return server
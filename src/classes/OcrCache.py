@@ -0,0 +1,151 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+_lock = threading.Lock()
+_path = None
+_log = None
+_budget = 0
+_max_age = 0
+_connection = None
+# Version of the table, a cache file created by an older version is emptied
+SCHEMA_VERSION = 2
+
+
+def reset():
+    global _connection
+    _connection = None
+
+
+# A forked worker opens its own connection, a SQLite connection can't be shared between processes
+os.register_at_fork(after_in_child=reset)
+
+
+def configure(config, log):
+    """
+    Enable the cache if the OCR_CACHE section of the config is active. All the processes of the server share the same SQLite file
+
+    :param config: Class Config instance
+    :param log: Class Log instance
+    """
+    global _path, _log, _budget, _max_age
+    cache_cfg = config.cfg.get('OCR_CACHE', {})
+    if cache_cfg.get('enabled') != 'True' or _path is not None:
+        return
+    _path = cache_cfg['path']
+    _log = log
+    _budget = int(cache_cfg.get('size') or 1024) * 1024 * 1024
+    _max_age = float(cache_cfg.get('maxage') or 30) * 86400
+
+
+def enabled():
+    return _path is not None
+
+
+def key(content, *settings):
+    """
+    :param content: Bytes of the image or of the file OCRised
+    :param settings: Everything changing the result of the OCR (language, mode, pages...)
+    :return: Key of the result into the cache
+    """
+    digest = hashlib.sha256(content)
+    for setting in settings:
+        digest.update(b'\0' + str(setting).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def image_key(img, *settings):
+    """
+    :param img: PIL Image, or path to the image
+    """
+    if isinstance(img, str):
+        with open(img, 'rb') as file:
+            return key(file.read(), *settings)
+    return key(img.tobytes(), img.mode, img.size, *settings)
+
+
+def file_key(path, *settings):
+    with open(path, 'rb') as file:
+        return key(file.read(), *settings)
+
+
+def connect():
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(_path) or '.', exist_ok=True)
+        _connection = sqlite3.connect(_path, timeout=30, check_same_thread=False)
+        _connection.execute('PRAGMA journal_mode=WAL')
+        _connection.execute('BEGIN IMMEDIATE')  # Another process could create the table at the same time
+        if _connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            _connection.execute('DROP TABLE IF EXISTS ocr')
+            _connection.execute('PRAGMA user_version = ' + str(SCHEMA_VERSION))
+        _connection.execute('CREATE TABLE IF NOT EXISTS ocr (key TEXT PRIMARY KEY, text TEXT, pdf BLOB, confidence REAL, size INTEGER, created REAL, used REAL)')
+        _connection.execute('CREATE INDEX IF NOT EXISTS ocr_used ON ocr (used)')
+        _connection.commit()
+    return _connection
+
+
+def get(cache_key):
+    """
+    :param cache_key: Key returned by image_key or file_key
+    :return: Tuple with the text, the searchable PDF (None if only the text was stored) and the confidence of the OCR, or None if not found
+    """
+    if _path is None:
+        return None
+    try:
+        with _lock:
+            connection = connect()
+            row = connection.execute('SELECT text, pdf, confidence FROM ocr WHERE key = ?', (cache_key,)).fetchone()
+            if row is not None:
+                connection.execute('UPDATE ocr SET used = ? WHERE key = ?', (time.time(), cache_key))
+                connection.commit()
+        return row
+    except sqlite3.Error as _e:
+        _log.error('OCR cache ERROR, the document will be OCRised : ' + str(_e))
+        return None
+
+
+def put(cache_key, text, pdf=None, confidence=None):
+    """
+    Store the result of an OCR, then remove the results older than maxAge and the least recently used ones beyond the size of the cache
+    """
+    if _path is None:
+        return
+    now = time.time()
+    try:
+        with _lock:
+            connection = connect()
+            connection.execute('INSERT OR REPLACE INTO ocr VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (cache_key, text, pdf, confidence, len(text.encode('utf-8')) + len(pdf or b''), now, now))
+            connection.execute('DELETE FROM ocr WHERE created < ?', (now - _max_age,))
+            size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM ocr').fetchone()[0]
+            if size > _budget:
+                removed = []
+                for old_key, old_size in connection.execute('SELECT key, size FROM ocr ORDER BY used'):
+                    if size <= _budget:
+                        break
+                    removed.append((old_key,))
+                    size -= old_size
+                connection.executemany('DELETE FROM ocr WHERE key = ?', removed)
+            connection.commit()
+    except sqlite3.Error as _e:
+        _log.error('OCR cache ERROR, the result is not stored : ' + str(_e))
@@ -0,0 +1,59 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+FIELDS = ('date', 'subject', 'chrono')
+
+
+def parse(value):
+    """
+    Read the OCR zones of the config, for example : date,subject:0,0,1,0.4;chrono:0.5,0,1,0.25
+    Each zone is left,top,right,bottom in fraction of the page (0 to 1)
+
+    :param value: Content of the ocrZones option
+    :return: Dict with the zone of each field
+    """
+    zones = {}
+    for zone in [zone.strip() for zone in value.split(';') if zone.strip()]:
+        fields, _, box = zone.partition(':')
+        roi = tuple(float(coordinate) for coordinate in box.split(','))
+        if len(roi) != 4 or not 0 <= roi[0] < roi[2] <= 1 or not 0 <= roi[1] < roi[3] <= 1:
+            raise ValueError('wrong zone ' + zone)
+        for field in [field.strip() for field in fields.split(',')]:
+            if field not in FIELDS:
+                raise ValueError('unknown field ' + field + ' in zone ' + zone)
+            zones[field] = roi
+    return zones
+
+
+def settings(cfg, process=None):
+    """
+    :param cfg: Content of the config (Config.cfg)
+    :param process: Name of the process section
+    :return: Dict with the zone of each field, empty to OCRise the full page
+    """
+    section = cfg.get(process) or {}
+    return parse(section.get('ocrzones', cfg['GLOBAL'].get('ocrzones', '')))
+
+
+def texts(zones, zone_texts):
+    """
+    :param zones: Dict with the zone of each field
+    :param zone_texts: Dict with the text of each zone
+    :return: Dict with the text of each field. A field without zone gets the text of all the zones
+    """
+    every_zone = '\n'.join(zone_texts.values())
+    return {field: zone_texts[zones[field]] if field in zones else every_zone for field in FIELDS}
@@ -0,0 +1,260 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import pypdf
+import threading
+from PIL import Image
+from collections import OrderedDict
+from pdf2image import convert_from_path
+from . import Metrics
+
+_active_lock = threading.Lock()
+_active = 0  # Documents with an open page cache in this process (pipeline, queue concurrency)
+_processes = 1  # Processes of this server handling documents at the same time (daemon, batch and queue workers)
+
+
+def set_processes(processes):
+    """
+    Set the number of processes rendering pages at the same time, before starting them. Each one will use a part of GLOBAL.nbthreads
+    """
+    global _processes
+    _processes = max(1, processes)
+
+
+class PageCache:
+    """
+    Pages of the processed document, rendered once and shared by the blank page removal, the barcode detection and the OCR.
+    Pages are rendered at the resolution asked by the first step reading them and resized for the steps needing a lower one.
+    A page is rendered again only if a step needs a higher resolution, like the OCR of the first page after the barcode detection,
+    or the colours of a page rendered in grayscale, like the blank page detection
+    Beyond the memory budget, the least recently used pages are written into the temporary folder of the document
+    """
+    def __init__(self, dpi, grayscale, budget, tmp_folder, chunk_size=8, threads=1):
+        """
+        :param dpi: Resolution of the pages asked without resolution
+        :param grayscale: Boolean to get the pages in grayscale if asked without mode
+        :param budget: Memory used by the pages, in MB. Beyond, pages are spilled to disk
+        :param tmp_folder: Folder of the spilled pages
+        :param chunk_size: Maximum number of pages rendered at once
+        :param threads: Threads of the server used for the rendering (GLOBAL.nbthreads), shared by the documents processed at the same time
+        """
+        global _active
+        with _active_lock:
+            _active += 1
+        self.closed = False
+        self.threads = max(1, threads)
+        self.chunk_size = max(1, chunk_size)
+        self.dpi = dpi
+        self.keys = {}  # (path, page) : key of the rendered page. Many paths point to the same page after a split
+        self.resolutions = {}  # key : resolution of the rendered page
+        self.size = 0
+        self.spilled = {}  # key : (path of the raw pixels, mode, size)
+        self.next_key = 0
+        self.grayscale = grayscale
+        self.tmp_folder = tmp_folder
+        self.lock = threading.Lock()
+        self.images = OrderedDict()  # key : PIL Image, the most recently used at the end
+        self.budget = budget * 1024 * 1024
+
+    @staticmethod
+    def nb_pages(path):
+        with open(path, 'rb') as file:
+            return len(pypdf.PdfReader(file, strict=False).pages)
+
+    def get(self, path, page=1, dpi=None, grayscale=None):
+        """
+        :param path: Path to the pdf
+        :param page: Number of the page, starting at 1
+        :param dpi: Resolution wanted. If None, the resolution of the cache
+        :param grayscale: Boolean to get the page in grayscale. If None, the mode of the cache
+        :return: PIL Image
+        """
+        path = os.path.normpath(path)
+        dpi = dpi or self.dpi
+        grayscale = self.grayscale if grayscale is None else grayscale
+        img, img_dpi = self.load((path, page))
+        if img is None or img_dpi < dpi or (not grayscale and img.mode == 'L'):
+            self.render(path, page, page, max(dpi, img_dpi or 0), grayscale)  # Never lose the resolution of the page already rendered
+            img, img_dpi = self.load((path, page))
+        return self.adapt(img, img_dpi, dpi, grayscale)
+
+    def iter_pages(self, path, dpi=None, grayscale=None):
+        """
+        Yield the pages of the pdf one by one. The missing pages are rendered by chunks, so only a chunk of rendered pages
+        and the pages kept under the memory budget are in memory, whatever the number of pages
+
+        :param dpi: Resolution wanted, the missing pages are rendered at this resolution. If None, the resolution of the cache
+        :param grayscale: Boolean to get the pages in grayscale, the missing pages are rendered in this mode. If None, the mode of the cache
+        :return: Generator of PIL Image
+        """
+        path = os.path.normpath(path)
+        dpi = dpi or self.dpi
+        grayscale = self.grayscale if grayscale is None else grayscale
+        nb_pages = self.nb_pages(path)
+        chunk_size = max(self.chunk_size, self.thread_count())  # At least one page for each pdftoppm process
+        for page in range(1, nb_pages + 1):
+            with self.lock:
+                if (path, page) not in self.keys:
+                    last_page = page
+                    while last_page < min(page + chunk_size - 1, nb_pages) and (path, last_page + 1) not in self.keys:
+                        last_page += 1
+                else:
+                    last_page = None
+            if last_page is not None:
+                self.render(path, page, last_page, dpi, grayscale)
+            yield self.get(path, page, dpi, grayscale)
+
+    def thread_count(self):
+        """
+        :return: Number of pdftoppm processes for a rendering, GLOBAL.nbthreads divided by the documents processed at the same time
+        """
+        return max(1, self.threads // (_processes * max(1, _active)))
+
+    def render(self, path, first_page, last_page, dpi, grayscale):
+        images = convert_from_path(path, first_page=first_page, last_page=last_page, dpi=dpi, grayscale=grayscale,
+                                   thread_count=min(self.thread_count(), last_page - first_page + 1))
+        Metrics.inc('opencapture_pages_rasterised_total', len(images))
+        for page, img in enumerate(images, first_page):
+            with self.lock:
+                key = self.keys.get((path, page))
+                if key is None:
+                    key = self.keys[(path, page)] = self.next_key
+                    self.next_key += 1
+                elif self.resolutions[key] >= dpi and (grayscale or self.mode(key) != 'L'):
+                    continue  # Already rendered by another thread
+                self.store(key, img, dpi)
+
+    def store(self, key, img, dpi):
+        """
+        Keep the rendered page, replacing the one rendered at a lower resolution
+        """
+        if key in self.images:
+            self.size -= self.weight(self.images.pop(key))
+        elif key in self.spilled:
+            os.remove(self.spilled.pop(key)[0])
+        self.images[key] = img
+        self.resolutions[key] = dpi
+        self.size += self.weight(img)
+        self.spill()
+
+    def load(self, page_key):
+        """
+        :return: Tuple with the PIL Image and its resolution, (None, None) if the page isn't rendered
+        """
+        with self.lock:
+            key = self.keys.get(page_key)
+            if key is None:
+                return None, None
+            if key in self.images:
+                self.images.move_to_end(key)
+                return self.images[key], self.resolutions[key]
+            path, mode, size = self.spilled.pop(key)
+            with open(path, 'rb') as file:
+                img = Image.frombytes(mode, size, file.read())
+            os.remove(path)
+            self.images[key] = img
+            self.size += self.weight(img)
+            self.spill(key)
+            return img, self.resolutions[key]
+
+    def spill(self, keep=None):
+        """
+        Write the least recently used pages into the temporary folder, until the memory budget is respected
+        """
+        while self.size > self.budget and len(self.images) > 1:
+            key = next(iter(self.images))
+            if key == keep:
+                break
+            img = self.images.pop(key)
+            self.size -= self.weight(img)
+            path = os.path.join(self.tmp_folder, 'page_' + str(key) + '.raw')
+            with open(path, 'wb') as file:
+                file.write(img.tobytes())
+            self.spilled[key] = (path, img.mode, img.size)
+
+    def mode(self, key):
+        return self.images[key].mode if key in self.images else self.spilled[key][1]
+
+    @staticmethod
+    def weight(img):
+        return img.size[0] * img.size[1] * len(img.getbands())
+
+    @staticmethod
+    def adapt(img, img_dpi, dpi, grayscale):
+        if grayscale and img.mode != 'L':
+            img = img.convert('L')
+        elif not grayscale and img.mode == 'L':
+            img = img.convert('RGB')
+        if dpi < img_dpi:
+            img = img.resize((round(img.size[0] * dpi / img_dpi), round(img.size[1] * dpi / img_dpi)), Image.BILINEAR, reducing_gap=2.0)
+        return img
+
+    def alias(self, path, source, pages):
+        """
+        Point the pages of a pdf created from another one (split, blank pages removed...) to the already rendered pages.
+        :path and :source could be the same file, rewritten
+
+        :param path: Path to the new pdf
+        :param source: Path to the pdf the pages come from
+        :param pages: Numbers of the pages of :source, in the order of the new pdf
+        """
+        path, source = os.path.normpath(path), os.path.normpath(source)
+        with self.lock:
+            keys = [self.keys.get((source, page)) for page in pages]
+            for page_key in [page_key for page_key in self.keys if page_key[0] == path]:
+                del self.keys[page_key]
+            for page, key in enumerate(keys, 1):
+                if key is not None:
+                    self.keys[(path, page)] = key
+            used = set(self.keys.values())
+            for key in [key for key in self.images if key not in used]:
+                self.size -= self.weight(self.images.pop(key))
+            for key in [key for key in self.spilled if key not in used]:
+                os.remove(self.spilled.pop(key)[0])
+            for key in [key for key in self.resolutions if key not in used]:
+                del self.resolutions[key]
+
+    def clear(self):
+        global _active
+        with _active_lock:
+            if not self.closed:
+                self.closed = True
+                _active -= 1
+        with self.lock:
+            for path, _, _ in self.spilled.values():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.keys, self.images, self.spilled, self.resolutions, self.size = {}, OrderedDict(), {}, {}, 0
+
+
+def from_config(config, tmp_folder):
+    """
+    :param config: Class Config instance
+    :param tmp_folder: Temporary folder of the document, for the spilled pages
+    :return: Class PageCache instance
+    """
+    return PageCache(
+        int(config.cfg['GLOBAL']['resolution']),
+        config.cfg['GLOBAL'].get('grayscale') == 'True',
+        int(config.cfg['GLOBAL'].get('pagecachesize') or 512),
+        tmp_folder,
+        int(config.cfg['GLOBAL'].get('pagechunksize') or 8),
+        int(config.cfg['GLOBAL']['nbthreads'])
+    )
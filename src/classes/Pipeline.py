@@ -0,0 +1,93 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import queue
+import threading
+
+# Sent through the queues once all the items are in, to stop the workers of the next stage
+STOP = object()
+
+
+class Pipeline:
+    """
+    Chain of stages, each one with its own pool of threads, connected by bounded queues.
+    When a queue is full, the previous stage waits : a slow stage (OCR, upload...) slows down the others
+    instead of piling up documents in memory. Different documents occupy different stages at the same time
+    """
+    def __init__(self, stages, log, queue_size=4, on_error=None):
+        """
+        :param stages: List of tuples (name, function, number of threads). Each function receives an item and returns
+                       the item for the next stage, a list of items (one item split in many) or None to drop it
+        :param log: Class Log instance
+        :param queue_size: Maximum number of items waiting between two stages
+        :param on_error: Function called with the item and the exception when a stage fails. The item is dropped
+        """
+        self.Log = log
+        self.stages = [(name, function, max(1, int(nb_workers))) for name, function, nb_workers in stages]
+        self.on_error = on_error
+        self.lock = threading.Lock()
+        self.queues = [queue.Queue(max(1, queue_size)) for _ in self.stages]
+        self.remaining = [nb_workers for _, _, nb_workers in self.stages]
+
+    def worker(self, index):
+        name, function, _ = self.stages[index]
+        input_queue = self.queues[index]
+        output_queue = self.queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = input_queue.get()
+            if item is STOP:
+                break
+            try:
+                res = function(item)
+            except (Exception, SystemExit) as _e:  # One bad document must not stop the pipeline
+                self.Log.error('Error in pipeline stage ' + name + ' : ' + str(_e))
+                if self.on_error:
+                    self.on_error(item, _e)
+                continue
+            if output_queue is None or res is None:
+                continue
+            for next_item in res if isinstance(res, list) else [res]:
+                output_queue.put(next_item)
+
+        # The last thread of a stage to stop tells the next stage that nothing else will come
+        with self.lock:
+            self.remaining[index] -= 1
+            last = self.remaining[index] == 0
+        if last and output_queue is not None:
+            for _ in range(self.stages[index + 1][2]):
+                output_queue.put(STOP)
+
+    def run(self, items):
+        """
+        Send all the items through the stages and wait for the end of the last one
+
+        :param items: Iterable of items given to the first stage
+        """
+        threads = []
+        for index, (name, _, nb_workers) in enumerate(self.stages):
+            for i in range(nb_workers):
+                thread = threading.Thread(target=self.worker, args=(index,), name=name + 'Thread-' + str(i), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        for item in items:
+            self.queues[0].put(item)
+        for _ in range(self.stages[0][2]):
+            self.queues[0].put(STOP)
+
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,140 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import cv2
+import numpy as np
+from PIL import Image
+from .Spans import span
+
+# Steps are always run in this order, whatever the order of the config
+STEPS = ('downscale', 'deskew', 'binarise', 'trim')
+MAX_SKEW = 5  # Degrees
+SKEW_PREVIEW_WIDTH = 800
+
+
+def settings(cfg, process=None):
+    """
+    Read the preprocessing options of a process section, or of the GLOBAL section if the process doesn't set them
+
+    :param cfg: Content of the config (Config.cfg)
+    :param process: Name of the process section
+    :return: Tuple with the list of steps and the OCR resolution
+    """
+    section = cfg.get(process) or {}
+    steps = section.get('preprocess', cfg['GLOBAL'].get('preprocess', ''))
+    ocr_resolution = section.get('ocrresolution') or cfg['GLOBAL'].get('ocrresolution') or 300
+    return [step for step in STEPS if step in [_step.strip() for _step in steps.split(',')]], int(ocr_resolution)
+
+
+def downscale(pixels, dpi, ocr_resolution):
+    if dpi <= ocr_resolution:
+        return pixels, {}
+    ratio = ocr_resolution / dpi
+    pixels = cv2.resize(pixels, (round(pixels.shape[1] * ratio), round(pixels.shape[0] * ratio)), interpolation=cv2.INTER_AREA)
+    return pixels, {'dpi': ocr_resolution}
+
+
+def skew_angle(pixels):
+    """
+    Find the rotation giving the sharpest profile of the text lines, on a small copy of the page
+
+    :param pixels: Grayscale image as a numpy array
+    :return: Angle in degrees
+    """
+    ratio = min(1, SKEW_PREVIEW_WIDTH / pixels.shape[1])
+    preview = cv2.resize(pixels, (round(pixels.shape[1] * ratio), round(pixels.shape[0] * ratio)), interpolation=cv2.INTER_AREA)
+    _, preview = cv2.threshold(preview, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    center = (preview.shape[1] / 2, preview.shape[0] / 2)
+
+    def sharpness(angle):
+        rotated = cv2.warpAffine(preview, cv2.getRotationMatrix2D(center, angle, 1), (preview.shape[1], preview.shape[0]), flags=cv2.INTER_NEAREST)
+        return np.var(rotated.sum(axis=1, dtype=np.int64))
+
+    angles = np.arange(-MAX_SKEW, MAX_SKEW + 0.5, 0.5)
+    best = max(angles, key=sharpness)
+    return max(np.arange(best - 0.4, best + 0.5, 0.1), key=sharpness)
+
+
+def deskew(pixels):
+    angle = round(float(skew_angle(pixels)), 1)
+    if abs(angle) < 0.1:
+        return pixels, {'angle': 0}
+    matrix = cv2.getRotationMatrix2D((pixels.shape[1] / 2, pixels.shape[0] / 2), angle, 1)
+    pixels = cv2.warpAffine(pixels, matrix, (pixels.shape[1], pixels.shape[0]), flags=cv2.INTER_LINEAR, borderValue=255)
+    return pixels, {'angle': angle}
+
+
+def binarise(pixels, dpi):
+    block = int(dpi / 10) | 1  # Odd neighbourhood of about 2.5 mm
+    return cv2.adaptiveThreshold(pixels, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, 15), {}
+
+
+def trim(pixels, dpi):
+    """
+    Remove the empty margins. Rows and columns with less than 0.5% of dark pixels (scan noise) are considered empty
+    """
+    _, dark = cv2.threshold(pixels, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    rows = np.flatnonzero(dark.sum(axis=1) > pixels.shape[1] * 0.005)
+    cols = np.flatnonzero(dark.sum(axis=0) > pixels.shape[0] * 0.005)
+    if not rows.size or not cols.size:  # Blank page
+        return pixels, {'removed': 0}
+    padding = int(dpi / 10)
+    top, bottom = max(0, rows[0] - padding), min(pixels.shape[0], rows[-1] + padding + 1)
+    left, right = max(0, cols[0] - padding), min(pixels.shape[1], cols[-1] + padding + 1)
+    removed = 1 - (bottom - top) * (right - left) / (pixels.shape[0] * pixels.shape[1])
+    return pixels[top:bottom, left:right], {'removed': round(float(removed), 3)}
+
+
+def run(img, steps, dpi, ocr_resolution):
+    """
+    Prepare a page for the OCR. Each step is recorded as a span (preprocess_deskew...), with its effect
+
+    :param img: PIL Image of the page
+    :param steps: List of steps (downscale, deskew, binarise, trim)
+    :param dpi: Resolution of :img
+    :param ocr_resolution: Resolution used for the OCR, the page is downscaled to it
+    :return: Tuple with the PIL Image to OCR and the effects of the steps
+    """
+    if not steps:
+        return img, {}
+    effects = {}
+    pixels = np.asarray(img.convert('L'))
+    for step in steps:
+        with span('preprocess_' + step) as details:
+            if step == 'downscale':
+                pixels, effect = downscale(pixels, dpi, ocr_resolution)
+                dpi = effect.get('dpi', dpi)
+            elif step == 'deskew':
+                pixels, effect = deskew(pixels)
+            elif step == 'binarise':
+                pixels, effect = binarise(pixels, dpi)
+            else:
+                pixels, effect = trim(pixels, dpi)
+            effect['pixels'] = int(pixels.shape[0] * pixels.shape[1])
+            details.update(effect)
+        effects[step] = effect
+    result = Image.fromarray(pixels)
+    result.info.update(img.info)
+    result.info['dpi'] = (dpi, dpi)  # Tesseract guesses the resolution of an image without one
+    return result, effects
+
+
+def describe(effects):
+    """
+    :return: Effects of the steps as a string, for the log
+    """
+    return ', '.join(step + ' ' + ' '.join(key + '=' + str(value) for key, value in effect.items()) for step, effect in effects.items())
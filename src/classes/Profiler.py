@@ -0,0 +1,150 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+PROFILE_MODES = ('cpu', 'alloc')
+
+
+class StackSampler(threading.Thread):
+    """
+    Sample the stacks of all the threads (finders included), to build a flame graph of the document
+    """
+    def __init__(self, interval=0.005):
+        threading.Thread.__init__(self, name='samplerThread', daemon=True)
+        self.stacks = {}
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code.co_name + ' (' + os.path.basename(frame.f_code.co_filename) + ':' + str(frame.f_code.co_firstlineno) + ')')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path):
+        """
+        Write the stacks in the collapsed format, used by flamegraph.pl or speedscope
+        """
+        with open(path, 'w') as file:
+            for stack, count in sorted(self.stacks.items()):
+                file.write(stack.replace(' ', '_') + ' ' + str(count) + '\n')
+
+
+class PeakSnapshotter(threading.Thread):
+    """
+    Keep the tracemalloc snapshot taken when the traced memory was the highest
+    """
+    def __init__(self, interval=0.2):
+        threading.Thread.__init__(self, name='snapshotThread', daemon=True)
+        self.size = 0
+        self.snapshot = None
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def check(self):
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.size:
+            self.size = current
+            self.snapshot = tracemalloc.take_snapshot()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.check()
+
+
+class ProfiledLaunch:
+    """
+    Wrap the launch function to write a profile of each document. Only used with --profile, so nothing is added to a normal launch.
+    The instance can be sent to the workers of the daemon or batch mode
+    """
+    def __init__(self, launch, mode, folder):
+        """
+        :param launch: Function processing a document (src.main.launch)
+        :param mode: cpu (cProfile pstats and collapsed stacks) or alloc (tracemalloc snapshot and peak)
+        :param folder: Folder of the profiles
+        """
+        self.mode = mode
+        self.launch = launch
+        self.folder = folder
+
+    def profile_name(self, args):
+        name = os.path.basename(str(args.get('file') or args.get('msg_uid') or 'document'))
+        return os.path.join(self.folder, time.strftime('%Y%m%d-%H%M%S') + '_' + str(os.getpid()) + '_' + name)
+
+    def __call__(self, args, resources=None):
+        os.makedirs(self.folder, exist_ok=True)
+        name = self.profile_name(args)
+        if self.mode == 'alloc':
+            return self.profile_alloc(name, args, resources)
+        return self.profile_cpu(name, args, resources)
+
+    def profile_cpu(self, name, args, resources):
+        profile = cProfile.Profile()
+        sampler = StackSampler()
+        sampler.start()
+        profile.enable()
+        try:
+            return self.launch(args, resources)
+        finally:
+            profile.disable()
+            sampler.stop()
+            profile.dump_stats(name + '.pstats')
+            sampler.write(name + '.collapsed')
+            with open(name + '.txt', 'w') as file:
+                pstats.Stats(profile, stream=file).sort_stats('cumulative').print_stats(40)
+
+    def profile_alloc(self, name, args, resources):
+        tracemalloc.start(25)
+        snapshotter = PeakSnapshotter()
+        snapshotter.start()
+        try:
+            return self.launch(args, resources)
+        finally:
+            snapshotter.stop()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshotter.snapshot.dump(name + '.tracemalloc')
+            with open(name + '.txt', 'w') as file:
+                file.write('Peak : ' + str(round(peak / 1024 / 1024, 2)) + ' MB, snapshot taken at ' + str(round(snapshotter.size / 1024 / 1024, 2)) + ' MB, ' +
+                           'still allocated at the end : ' + str(round(current / 1024 / 1024, 2)) + ' MB\n\n')
+                for stat in snapshotter.snapshot.statistics('lineno')[:30]:
+                    file.write(str(stat) + '\n')
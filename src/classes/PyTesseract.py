@@ -16,35 +16,141 @@
 # @dev : Nathan Cheval <nathan.cheval@outlook.fr>
 
 import ocrmypdf
+import threading
 import pytesseract
+from . import OcrCache
+from .Spans import span, timed
+
+try:
+    import tesserocr
+except ImportError:  # tesserocr is optional, pytesseract starts a tesseract process for each image instead
+    tesserocr = None
+
+_engines = threading.local()  # Tesseract APIs of each thread, the language models stay loaded from one image to another
+_cli_version = None  # Version of the tesseract command, used by pytesseract and ocrmypdf
+
+
+def engine(lang, log):
+    """
+    Get the Tesseract API of the current thread for a language, created at the first call.
+    An API can't be used by two threads at the same time, so each OCR thread has its own
+
+    :param lang: Language of the OCR (fra, eng, fra+eng...)
+    :param log: Class Log instance
+    :return: tesserocr.PyTessBaseAPI instance, or None if tesserocr isn't available
+    """
+    if tesserocr is None:
+        return None
+    apis = _engines.__dict__.setdefault('apis', {})
+    if lang not in apis:
+        try:
+            apis[lang] = tesserocr.PyTessBaseAPI(lang=lang)
+        except RuntimeError as _e:  # Missing language data, pytesseract is used instead
+            log.error('Tesseract API could not be loaded for ' + lang + ', pytesseract will be used : ' + str(_e))
+            apis[lang] = None
+    return apis[lang]
+
+
+def engine_version(api):
+    """
+    Name and version of the engine reading the text, part of the OCR cache keys : a new engine gives a new result
+
+    :param api: tesserocr API returned by engine, None if pytesseract is used
+    :return: String
+    """
+    global _cli_version
+    if api is not None:
+        return 'tesserocr ' + tesserocr.tesseract_version()
+    if _cli_version is None:
+        try:
+            _cli_version = str(pytesseract.get_tesseract_version())
+        except (pytesseract.TesseractNotFoundError, OSError):
+            return 'tesseract unknown'
+    return 'tesseract ' + _cli_version
 
 
 class PyTesseract:
     def __init__(self, locale, log, config):
         self.Log = log
         self.text = ''
+        self.confidence = None  # Mean confidence (0 to 100) of the words read by text_builder
+        self.tier = None  # Resolution of the OCR of the first page : fast or full
         self.tool = ''
         self.lang = locale
         self.Config = config
+        self.field_text = {}  # Text of the date, subject and chrono zones, if only these zones were OCRised
+        self.mode = 'skip'  # Mode of ocrmypdf for generate_searchable_pdf (skip, redo or force), planned from the text layer of the document
+        self.pages = None  # Numbers of the pages to OCRise with generate_searchable_pdf, None for all the pages
         self.searchablePdf = ''
+        self.page_texts = []  # Text of each page OCRised by generate_searchable_pdf
+        OcrCache.configure(config, log)
 
     def text_builder(self, img):
         """
-        OCRise image to simple string contains all the text
+        OCRise image to simple string contains all the text. The text of an image already OCRised is read from the OCR cache
+
+        :param img: PIL Image, or path to image file which will be ocresised
+        """
+        self.confidence = None
+        cache_key = None
+        if OcrCache.enabled():
+            with span('ocr_cache') as details:
+                cache_key = OcrCache.image_key(img, self.lang, engine_version(engine(self.lang, self.Log)))
+                cached = OcrCache.get(cache_key)
+                details['hit'] = cached is not None
+            if cached is not None:
+                self.text, _, self.confidence = cached
+                return
+        if self.read_text(img) and cache_key is not None:
+            OcrCache.put(cache_key, self.text, confidence=self.confidence)
 
-        :param img: Path to image file which will be ocresised
+    @timed('text_builder')
+    def read_text(self, img):
+        """
+        :param img: PIL Image, or path to image file which will be ocresised
+        :return: Boolean to show if the OCR ended well
         """
+        api = engine(self.lang, self.Log)
+        if api is not None:
+            try:
+                if isinstance(img, str):
+                    api.SetImageFile(img)
+                else:
+                    api.SetImage(img)
+                self.text = api.GetUTF8Text()
+                self.confidence = api.MeanTextConf()
+                return True
+            except RuntimeError as _e:
+                self.Log.error('Tesseract API ERROR, pytesseract will be used : ' + str(_e))
+            finally:
+                api.Clear()  # Free the image, the language model stays loaded
+
         try:
-            self.text = pytesseract.image_to_string(
-                img,
-                lang=self.lang
-            )
+            # Text and words with their confidence, from the same tesseract process
+            self.text, words = pytesseract.pytesseract.run_and_get_multiple_output(img, extensions=['txt', 'tsv'], lang=self.lang)
+            self.confidence = self.mean_confidence(words)
+            return True
         except pytesseract.pytesseract.TesseractError as t:
             self.Log.error('Tesseract ERROR : ' + str(t))
+            return False
+
+    @staticmethod
+    def mean_confidence(tsv):
+        """
+        :param tsv: TSV output of tesseract, one line for each block, paragraph, line and word
+        :return: Mean confidence of the words, 0 if no word was read
+        """
+        confidences = []
+        for line in tsv.splitlines()[1:]:
+            fields = line.split('\t')
+            if len(fields) == 12 and fields[0] == '5' and fields[11].strip() and float(fields[10]) >= 0:
+                confidences.append(float(fields[10]))
+        return sum(confidences) / len(confidences) if confidences else 0
 
     def generate_searchable_pdf(self, pdf, tmp_path, separator):
         """
-        Start from standard PDF, with no OCR, and create a searchable PDF, with OCR. Thanks to ocrmypdf python lib
+        Start from standard PDF, with no OCR, and create a searchable PDF, with OCR. Thanks to ocrmypdf python lib.
+        The mode and the pages are planned before (TextLayer.plan), so the document is OCRised only once
 
         :param pdf: Path to original pdf (not searchable, without OCR)
         :param tmp_path: Path to store the final pdf, searchable with OCR
@@ -52,14 +158,38 @@ class PyTesseract:
         """
         try:
             output_file = tmp_path + '/result.pdf'
-            res = ocrmypdf.ocr(pdf, output_file, output_type='pdf', skip_text=True, language=self.lang, progress_bar=False, jobs=int(self.Config.cfg['GLOBAL']['nbthreads']))
+            sidecar = tmp_path + '/result.txt'  # Text of the OCR, used to search the date, subject... without OCRising the first page again
+            pages = ','.join(str(page) for page in self.pages) if self.pages else None
+            mode = {'skip': {'skip_text': True}, 'redo': {'redo_ocr': True}, 'force': {'force_ocr': True}}[self.mode]
+            cache_key = None
+            if OcrCache.enabled():
+                with span('ocr_cache') as details:
+                    cache_key = OcrCache.file_key(pdf, self.lang, self.mode, pages, separator.convert_to_pdfa, 'ocrmypdf ' + ocrmypdf.__version__, engine_version(None))
+                    cached = OcrCache.get(cache_key)
+                    details['hit'] = cached is not None and cached[1] is not None
+                if details['hit']:
+                    self.page_texts = cached[0].split('\f')
+                    self.searchablePdf = cached[1]
+                    return
+            with span('generate_searchable_pdf') as details:
+                details['mode'] = self.mode
+                details['pages'] = pages or 'all'
+                res = ocrmypdf.ocr(pdf, output_file, output_type='pdf', pages=pages, sidecar=sidecar, language=self.lang, progress_bar=False,
+                                   jobs=int(self.Config.cfg['GLOBAL']['nbthreads']), **mode)
             if res.value != 0:
-                ocrmypdf.ocr(pdf, output_file, output_type='pdf', force_ocr=True, language=self.lang, progress_bar=False, jobs=int(self.Config.cfg['GLOBAL']['nbthreads']))
+                self.Log.error('ocrmypdf ERROR (' + self.mode + ' mode) : ' + str(res))
+                self.searchablePdf = False
+                return
+            with open(sidecar, 'r', encoding='utf-8') as text_file:
+                self.page_texts = text_file.read().split('\f')  # Pages are separated by form feeds
 
             if separator.convert_to_pdfa == "True":
                 output_file = tmp_path + '/result-pdfa.pdf'
                 separator.convert_to_pdfa_function(output_file, tmp_path + '/result.pdf', self.Log)
 
             self.searchablePdf = open(output_file, 'rb').read()
+            if cache_key is not None:
+                OcrCache.put(cache_key, '\f'.join(self.page_texts), self.searchablePdf)
         except ocrmypdf.exceptions.PriorOcrFoundError as e:
             self.Log.error(e)
+            self.searchablePdf = False
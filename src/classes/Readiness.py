@@ -0,0 +1,124 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # inotify_simple is optional, the size stability check is used instead
+    INotify = None
+
+# Filesystems where inotify doesn't see the writes done by other hosts
+NETWORK_FS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'glusterfs', 'ceph', '9p')
+# A file not modified for this long (in seconds) is considered complete. The window grows if the writer is slow
+QUIET = 0.5
+# Same, when the writes are only seen through the size and the modification time (network shares)
+STABLE = 1
+MAX_QUIET = 3
+
+
+def filesystem_type(path):
+    """
+    :return: Type of the filesystem of :path (ext4, nfs4, cifs...), None if it couldn't be found
+    """
+    path = os.path.realpath(path)
+    fs_type, mount_point = None, ''
+    try:
+        with open('/proc/mounts', 'r') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) > 2 and (path == fields[1] or path.startswith(fields[1].rstrip('/') + '/')) and len(fields[1]) > len(mount_point):
+                    fs_type, mount_point = fields[2], fields[1]
+    except OSError:
+        pass
+    return fs_type
+
+
+def age(path):
+    return time.time() - os.path.getmtime(path)
+
+
+def wait_until_ready(path, timeout=10):
+    """
+    Wait until nobody writes into the file anymore
+
+    :param path: Path to the file
+    :param timeout: Maximum time to wait, in seconds
+    :return: Boolean to show if the file is ready
+    """
+    if age(path) >= MAX_QUIET:  # Nobody wrote into it for a while, no need to wait
+        return True
+    if INotify is not None and filesystem_type(path) not in NETWORK_FS:
+        try:
+            return wait_with_inotify(path, timeout)
+        except OSError:  # Too many watches or instances
+            pass
+    return wait_for_stable_size(path, timeout)
+
+
+def wait_with_inotify(path, timeout):
+    """
+    The file is ready as soon as it is closed after writing, or when it isn't modified during the quiet window.
+    The window grows with the gaps seen between two writes, to wait for the slow writers (scanner over SMB...)
+    """
+    inotify = INotify()
+    try:
+        inotify.add_watch(path, flags.CLOSE_WRITE | flags.MODIFY)
+        deadline = time.time() + timeout
+        quiet = QUIET
+        last_write = time.time() - age(path)
+        while time.time() < deadline:
+            events = inotify.read(timeout=int(quiet * 1000))
+            if any(event.mask & flags.CLOSE_WRITE for event in events):
+                return True
+            if not events:
+                if age(path) >= quiet:
+                    return True
+                continue
+            now = time.time()
+            quiet = min(MAX_QUIET, max(quiet, 2 * (now - last_write)))
+            last_write = now
+        return False
+    finally:
+        inotify.close()
+
+
+def wait_for_stable_size(path, timeout):
+    """
+    Fallback for the network shares : the file is ready when its size and modification time didn't change for STABLE seconds.
+    The window grows with the gaps seen between two changes
+    """
+    deadline = time.time() + timeout
+    quiet = STABLE
+    interval = 0.05
+    previous = None
+    last_change = 0
+    while time.time() < deadline:
+        stat = os.stat(path)
+        current = (stat.st_size, stat.st_mtime)
+        if previous is None:
+            previous, last_change = current, stat.st_mtime
+        elif current != previous:
+            now = time.time()
+            quiet = min(MAX_QUIET, max(quiet, 2 * (now - last_change)))
+            previous, last_change = current, now
+        if time.time() - last_change >= quiet:
+            return True
+        time.sleep(interval)
+        interval = min(quiet / 4, interval * 2)
+    return False
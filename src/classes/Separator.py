@@ -16,20 +16,30 @@
 # @dev : Nathan Cheval <nathan.cheval@outlook.fr>
 # @dev : Pierre-Yvon Bezert <pierreyvon.bezert@edissyum.com>
 
+import io
 import os
 import re
 import cv2
 import uuid
 import pypdf
 import shutil
-import pdf2image
 import subprocess
-from pyzbar.pyzbar import decode
+import numpy as np
+from pyzbar.pyzbar import decode, ZBarSymbol
 import xml.etree.ElementTree as ET
+from . import PageCache
+from .Spans import span, timed
+
+# Resolution of the pages read by the blank page detection and the barcode readers
+DETECTION_DPI = 200
+ZBAR_NS = 'http://zbar.sourceforge.net/2008/barcode'
 
 
 class Separator:
-    def __init__(self, log, config, tmp_folder, process):
+    def __init__(self, log, config, tmp_folder, process, page_cache=None):
+        """
+        :param page_cache: Class PageCache instance shared with the OCR. If None, the separator uses its own
+        """
         self.pj = []
         self.Log = log
         self.pages = []
@@ -52,13 +62,14 @@ class Separator:
 
         os.mkdir(self.output_dir)
         os.mkdir(self.output_dir_pdfa)
+        self.page_cache = page_cache or PageCache.from_config(config, tmp_folder)
 
     @staticmethod
     def is_blank_page(image, config) -> bool:
         """
          Check if a page is blank
 
-        :param image: Image path
+        :param image: Image path or image as a numpy array
         :param config: Instance of Config class
         :return: True if the page is blank. False if not
         """
@@ -75,9 +86,9 @@ class Separator:
         params.minInertiaRatio = 0.01
 
         detector = cv2.SimpleBlobDetector_create(params)
-        im = cv2.imread(image)
+        im = cv2.imread(image) if isinstance(image, str) else image
         keypoints = detector.detect(im)
-        rows, cols, channel = im.shape
+        rows, cols = im.shape[:2]
         blobs_ratio = len(keypoints) / (1.0 * rows * cols)
         if blobs_ratio < float(config['SEPARATOR_QR']['blobsratio']):
             return True
@@ -94,25 +105,29 @@ class Separator:
 
         try:
             if self.Config.cfg['SEPARATOR_QR']['removeblankpage'] == 'True':
-                self.remove_blank_page(file)
+                with span('separator_remove_blank_page'):
+                    self.remove_blank_page(file)
             with open(file, 'rb') as pdf_file:
                 pdf = pypdf.PdfReader(pdf_file)
                 self.nb_pages = len(pdf.pages)
 
-            if self.Config.cfg['SEPARATOR_QR']['separationtype'] == 'C128':
-                self.get_xml_c128(file)
-            else:
-                self.get_xml_qr_code(file)
+            with span('separator_read_codes'):
+                if self.Config.cfg['SEPARATOR_QR']['separationtype'] == 'C128':
+                    self.get_xml_c128(file)
+                else:
+                    self.get_xml_qr_code(file)
 
             self.parse_xml()
             self.check_empty_docs()
             self.set_doc_ends()
-            self.extract_and_convert_docs(file)
+            with span('separator_split_docs'):
+                self.extract_and_convert_docs(file)
             if not self.pages or self.nb_pages == 1 and self.pages[0]['is_empty'] is False:
                 self.pdf_list.append(self.output_dir + '/' + os.path.basename(file))
             self.extract_pj()
             self.set_doc_ends(True)
-            self.extract_and_convert_docs(file, True)
+            with span('separator_split_pj'):
+                self.extract_and_convert_docs(file, True)
 
             if len(self.pages) == 0:
                 self.extract_only_pj(file)
@@ -122,6 +137,7 @@ class Separator:
             if len(self.pj) == 0 and len(self.pages) == 0:
                 try:
                     shutil.move(file, self.output_dir)
+                    self.page_cache.alias(self.output_dir + '/' + os.path.basename(file), file, range(1, self.nb_pages + 1))
                 except shutil.Error as _e:
                     self.Log.error('Moving file ' + file + ' error : ' + str(_e))
                 return
@@ -171,35 +187,23 @@ class Separator:
             self.extract_and_convert_docs(file, True)
 
     def remove_blank_page(self, file):
-        pages = pdf2image.convert_from_path(file)
-        i = 1
-        for page in pages:
-            page.save(self.output_dir + '/result-' + str(i) + '.jpg', 'JPEG')
-            i = i + 1
-
-        blank_page_exists = False
+        nb_pages = 0
         pages_to_keep = []
-        for _file in self.sorted_files(os.listdir(self.output_dir)):
-            if _file.endswith('.jpg'):
-                if not self.is_blank_page(self.output_dir + '/' + _file, self.Config.cfg):
-                    pages_to_keep.append(os.path.splitext(_file)[0].split('-')[1])
-                else:
-                    blank_page_exists = True
-
-                try:
-                    os.remove(self.output_dir + '/' + _file)
-                except FileNotFoundError:
-                    pass
+        for page in self.page_cache.iter_pages(file, DETECTION_DPI, False):
+            nb_pages += 1
+            if not self.is_blank_page(jpeg_array(page), self.Config.cfg):
+                pages_to_keep.append(nb_pages)
 
-        if blank_page_exists:
+        if len(pages_to_keep) < nb_pages:
             infile = pypdf.PdfReader(file)
             output = pypdf.PdfWriter()
-            for i in self.sorted_files(pages_to_keep):
-                p = infile.pages[int(i) - 1]
+            for i in pages_to_keep:
+                p = infile.pages[i - 1]
                 output.add_page(p)
 
             with open(file, 'wb') as f:
                 output.write(f)
+            self.page_cache.alias(file, file, pages_to_keep)
 
     def get_xml_c128(self, file):
         """
@@ -207,10 +211,9 @@ class Separator:
 
         :param file: Path to pdf file
         """
-        pages = pdf2image.convert_from_path(file)
         barcodes = []
         cpt = 0
-        for page in pages:
+        for page in self.page_cache.iter_pages(file, DETECTION_DPI, True):
             detected_barcode = decode(page)
             if detected_barcode:
                 for barcode in detected_barcode:
@@ -223,28 +226,24 @@ class Separator:
 
     def get_xml_qr_code(self, file):
         """
-        Retrieve the content of a QR Code
+        Retrieve the content of a QR Code. The result has the same structure as the XML output of zbarimg
 
         :param file: Path to pdf file
         """
-        try:
-            xml = subprocess.Popen([
-                'zbarimg',
-                '--xml',
-                '-q',
-                '-Sdisable',
-                '-Sqr.enable',
-                file
-            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            out, err = xml.communicate()
-            if out.decode('utf-8') == "<barcodes xmlns='http://zbar.sourceforge.net/2008/barcode'>\n<source href='" + file + "'>\n</source>\n</barcodes>\n":
-                return
-            if err.decode('utf-8'):
-                self.Log.error('ZBARIMG : ' + str(err))
-            self.qrList = ET.fromstring(out)
-        except subprocess.CalledProcessError as cpe:
-            if cpe.returncode != 4:
-                self.Log.error("ZBARIMG : \nreturn code: %s\ncmd: %s\noutput: %s\nglobal : %s" % (cpe.returncode, cpe.cmd, cpe.output, cpe))
+        barcodes = ET.Element('{%s}barcodes' % ZBAR_NS)
+        source = ET.SubElement(barcodes, '{%s}source' % ZBAR_NS, href=file)
+        cpt = 0
+        for page in self.page_cache.iter_pages(file, DETECTION_DPI, True):
+            detected_barcode = decode(page, symbols=[ZBarSymbol.QRCODE])
+            if detected_barcode:
+                index = ET.SubElement(source, '{%s}index' % ZBAR_NS, num=str(cpt))
+                for barcode in detected_barcode:
+                    symbol = ET.SubElement(index, '{%s}symbol' % ZBAR_NS, type='QR-Code')
+                    ET.SubElement(symbol, '{%s}data' % ZBAR_NS).text = barcode.data.decode('utf-8')
+            cpt += 1
+
+        if len(source):
+            self.qrList = barcodes
 
     def parse_xml(self, is_pj=False, original_filename=False):
         """
@@ -358,7 +357,7 @@ class Separator:
                     self.qrList = None
                     self.get_xml_qr_code(page['pdf_filename'])
                     pdf = pypdf.PdfReader(open(page['pdf_filename'], 'rb'))
-                    self.nb_pages = pdf.getNumPages()
+                    self.nb_pages = len(pdf.pages)
                     self.parse_xml(True, page['pdf_filename'])
             except Exception as _e:
                 self.Log.error("EACD: " + str(_e))
@@ -392,12 +391,16 @@ class Separator:
                     else:
                         self.pdf_list.append(page['pdf_filename'])
                     split_pdf(file, page['pdf_filename'], pages_to_keep, original_pages_to_keep)
+                    self.page_cache.alias(page['pdf_filename'], file, pages_to_keep)
+                    if original_pages_to_keep:
+                        self.page_cache.alias(file, file, original_pages_to_keep)
                 if not is_pj and delete_orig:
                     os.remove(file)
             except Exception as _e:
                 self.Log.error("EACD: " + str(_e))
 
     @staticmethod
+    @timed('pdfa_conversion')
     def convert_to_pdfa_function(pdfa_filename, pdf_filename, log):
         """
         Convert a simple PDF to a PDF/A
@@ -414,6 +417,18 @@ class Separator:
         os.remove(pdf_filename)
 
 
+def jpeg_array(img):
+    """
+    The blobsratio of the config was set on colour pages saved as JPEG and read by cv2.imread, give the same input to the blank page detection
+
+    :param img: PIL Image
+    :return: BGR numpy array, as read by cv2.imread
+    """
+    buffer = io.BytesIO()
+    img.convert('RGB').save(buffer, 'JPEG')
+    return cv2.imdecode(np.frombuffer(buffer.getvalue(), np.uint8), cv2.IMREAD_COLOR)
+
+
 def split_pdf(input_path, output_path, pages, original_pages_to_keep=None):
     """
     Finally, split PDF into multiple PDF
@@ -0,0 +1,208 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import sys
+import json
+import math
+import time
+import functools
+import threading
+import contextlib
+
+# Document processed by the current thread
+_local = threading.local()
+_write_lock = threading.Lock()
+# Functions called with the name and the wall time of every span (see Metrics)
+listeners = []
+# The spans file is rotated like the log file
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 2
+
+
+class Document:
+    """
+    Timings of the processed document. Each span is a step (pdf_to_jpg, text_builder, insert_with_args...)
+    with its wall time and the CPU time of the thread running it (the CPU used by tesseract, ghostscript... isn't counted)
+    """
+    def __init__(self, path, process):
+        self.path = path
+        self.spans = []
+        self.process = process
+        self.start = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, name, wall, cpu, details=None):
+        with self.lock:
+            self.spans.append({'name': name, 'wall': round(wall, 4), 'cpu': round(cpu, 4)})
+            if details:
+                self.spans[-1]['details'] = details
+
+    def record(self, inserted, error=None):
+        return {
+            'file': self.path,
+            'process': self.process,
+            'start': round(self.start, 3),
+            'wall': round(time.time() - self.start, 4),
+            'inserted': inserted,
+            'error': error,
+            'spans': self.spans
+        }
+
+
+def start_document(path, process):
+    """
+    Start to record the spans of a document, in the current thread
+
+    :return: Class Document instance
+    """
+    document = Document(path, process)
+    set_current(document)
+    return document
+
+
+def set_current(document):
+    """
+    Record the spans of the current thread into :document (threads working for a document started by another one)
+    """
+    _local.document = document
+
+
+def current():
+    return getattr(_local, 'document', None)
+
+
+@contextlib.contextmanager
+def span(name, document=None):
+    """
+    Time a step of the current document. Does nothing if no document is recorded and no listener is set.
+    The step could fill the yielded dict with details written with the span (angle of the deskew...)
+
+    :param name: Name of the step
+    :param document: Class Document instance, if the step runs into a thread which doesn't know the current document
+    """
+    details = {}
+    document = document or current()
+    if document is None and not listeners:
+        yield details
+        return
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        yield details
+    finally:
+        wall = time.perf_counter() - wall
+        if document is not None:
+            document.add(name, wall, time.thread_time() - cpu, details)
+        for listener in listeners:
+            listener(name, wall)
+
+
+def timed(name):
+    """
+    Decorator version of span
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def end_document(document, spans_file, inserted, error=None):
+    """
+    Write the record of the document as one JSON line
+
+    :param document: Class Document instance
+    :param spans_file: Path to the JSON lines file. If empty, nothing is written
+    :param inserted: Boolean to show if the document was inserted into MEM Courrier
+    :param error: Error message, if any
+    """
+    if current() is document:
+        set_current(None)
+    if not spans_file:
+        return
+    line = json.dumps(document.record(inserted, error)) + '\n'
+    with _write_lock:
+        if os.path.isfile(spans_file) and os.path.getsize(spans_file) + len(line) > MAX_BYTES:
+            rotate(spans_file)
+        with open(spans_file, 'a') as file:
+            file.write(line)
+
+
+def rotate(spans_file):
+    """
+    Rename spans.jsonl into spans.jsonl.1, spans.jsonl.1 into spans.jsonl.2... The oldest one is replaced
+    """
+    for i in range(BACKUP_COUNT - 1, 0, -1):
+        if os.path.isfile(spans_file + '.' + str(i)):
+            os.replace(spans_file + '.' + str(i), spans_file + '.' + str(i + 1))
+    os.replace(spans_file, spans_file + '.1')
+
+
+def percentile(values, p):
+    """
+    :param values: Sorted list of numbers
+    :param p: Percentile, between 0 and 100
+    :return: Value of the percentile (nearest rank)
+    """
+    if not values:
+        return 0
+    return values[min(len(values), max(1, math.ceil(p / 100 * len(values)))) - 1]
+
+
+def report(spans_files):
+    """
+    Aggregate the records of JSON lines files. A step done many times for a document (separated documents, WebServices calls...)
+    is summed for this document. Then p50, p95 and p99 are computed for each process and step
+
+    :param spans_files: List of paths to the JSON lines files (spans.jsonl and its rotated files)
+    :return: Report as a string
+    """
+    processes = {}
+    for spans_file in spans_files:
+        with open(spans_file, 'r') as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                steps = processes.setdefault(record['process'], {})
+                totals = {'total': [record['wall'], 0]}
+                for _span in record['spans']:
+                    total = totals.setdefault(_span['name'], [0, 0])
+                    total[0] += _span['wall']
+                    total[1] += _span['cpu']
+                for name, (wall, cpu) in totals.items():
+                    steps.setdefault(name, {'wall': [], 'cpu': []})
+                    steps[name]['wall'].append(wall)
+                    steps[name]['cpu'].append(cpu)
+
+    lines = []
+    for process, steps in sorted(processes.items()):
+        lines.append(process + ' (' + str(len(steps['total']['wall'])) + ' document(s))')
+        lines.append('  %-28s %6s %9s %9s %9s %9s' % ('step', 'count', 'p50', 'p95', 'p99', 'cpu p50'))
+        for name, values in sorted(steps.items(), key=lambda item: -sum(item[1]['wall'])):
+            wall = sorted(values['wall'])
+            cpu = sorted(values['cpu'])
+            lines.append('  %-28s %6d %8.3fs %8.3fs %8.3fs %8.3fs' % (name, len(wall), percentile(wall, 50), percentile(wall, 95), percentile(wall, 99), percentile(cpu, 50)))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(report(sys.argv[1:]))
@@ -0,0 +1,167 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import queue
+import signal
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import multiprocessing
+from kuyruk import importer
+from kuyruk.worker import Worker
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class OCForMEMWorker(Worker):
+    """
+    Kuyruk worker with a configurable prefetch, which runs up to :concurrency tasks at the same time in threads.
+    Acknowledgements are always sent by the thread owning the AMQP channel
+    """
+    def __init__(self, app, queues, prefetch=1, concurrency=1):
+        args = argparse.Namespace(queues=list(queues), logging_level=None, max_run_time=None, max_load=None, priority=None)
+        Worker.__init__(self, app, args)
+        self.finished = queue.Queue()
+        self.concurrency = concurrency
+        self.prefetch = max(prefetch, concurrency)  # Below concurrency, some threads would always wait
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix='taskThread')
+
+    def _consume_messages(self):
+        with self.kuyruk.new_connection() as connection:
+            ch = connection.channel()
+            ch.basic_qos(0, self.prefetch, False)
+            self._declare_queues(ch)
+            self._consume_queues(ch)
+            logger.info('Consumer started with prefetch %d and concurrency %d', self.prefetch, self.concurrency)
+            self._main_loop(ch)
+            ch.close()
+
+    def _main_loop(self, ch):
+        while not self.shutdown_pending.is_set():
+            self._pause_or_resume(ch)
+            ch.connection.heartbeat_tick()
+            self._acknowledge()
+            try:
+                ch.connection.drain_events(timeout=0.2)
+            except socket.timeout:
+                pass
+        # Let the running tasks end before closing the channel
+        self.executor.shutdown(wait=True)
+        self._acknowledge()
+
+    def _process_task(self, message, description, task, args, kwargs):
+        self.executor.submit(self._run_in_thread, message, task, args, kwargs)
+
+    def _run_in_thread(self, message, task, args, kwargs):
+        try:
+            task.apply(*args, **kwargs)
+            self.finished.put((message, True))
+        except (Exception, SystemExit):  # exit() of a bad document must not leave the message unacknowledged
+            logger.error('Task raised an exception:\n%s', traceback.format_exc())
+            self.finished.put((message, False))
+
+    def _acknowledge(self):
+        while True:
+            try:
+                message, success = self.finished.get_nowait()
+            except queue.Empty:
+                return
+            if success:
+                message.channel.basic_ack(message.delivery_tag)
+            else:
+                message.channel.basic_reject(message.delivery_tag, requeue=False)
+
+
+def run_kuyruk_worker(app, queues, prefetch, concurrency):
+    OCForMEMWorker(app, queues, prefetch, concurrency).run()
+
+
+class LocalBroker:
+    """
+    Stand-in for RabbitMQ, to run the workers on a single machine without broker (load tests, development).
+    Messages have the same content as the Kuyruk ones
+    """
+    def __init__(self):
+        self.queue = multiprocessing.JoinableQueue()
+
+    def send_to_queue(self, task, args=(), kwargs=None):
+        self.queue.put(task._get_description(args, kwargs or {}))
+
+    def consume(self, stop):
+        tasks = {}
+        while not stop.is_set():
+            try:
+                description = self.queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if description is None:  # Sentinel sent by close()
+                self.queue.task_done()
+                return
+            try:
+                key = (description['module'], description['function'])
+                if key not in tasks:
+                    tasks[key] = importer.import_object(*key)
+                tasks[key].apply(*description['args'], **description['kwargs'])
+            except (Exception, SystemExit):  # exit() of a bad document must not stop the consumer thread
+                logger.error('Task raised an exception:\n%s', traceback.format_exc())
+            finally:
+                self.queue.task_done()
+
+    def run_worker(self, concurrency):
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        threads = [threading.Thread(target=self.consume, args=(stop,), name='taskThread-' + str(i)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def close(self, nb_consumers):
+        """
+        Ask all the consumers to stop once the queue is empty
+
+        :param nb_consumers: Number of workers multiplied by the concurrency of each one
+        """
+        for _ in range(nb_consumers):
+            self.queue.put(None)
+
+
+def run_workers(nb_workers, target, *args):
+    """
+    Start :nb_workers worker processes and wait for them. SIGTERM and SIGINT are forwarded to the workers
+
+    :param nb_workers: Number of processes
+    :param target: Function run by each process (run_kuyruk_worker or LocalBroker.run_worker)
+    :param args: Arguments of :target
+    """
+    processes = [multiprocessing.Process(target=target, args=args, name='worker-' + str(i)) for i in range(nb_workers)]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for _process in processes:
+            if _process.is_alive():
+                _process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
@@ -0,0 +1,174 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import pypdf
+from .Spans import timed
+
+MAX_FORM_DEPTH = 4  # Form XObjects nested deeper are ignored
+OCR_MODES = ('auto', 'skip', 'redo', 'force')
+
+
+def page_text(file, page=1):
+    """
+    Read the text layer of a page of PDF, without OCR
+
+    :param file: Path to the pdf
+    :param page: Number of the page, starting at 1
+    :return: Text of the page, empty if the page has no text layer or couldn't be read
+    """
+    try:
+        with open(file, 'rb') as pdf_file:
+            pdf = pypdf.PdfReader(pdf_file, strict=False)
+            if page > len(pdf.pages):
+                return ''
+            return pdf.pages[page - 1].extract_text() or ''
+    except (OSError, pypdf.errors.PyPdfError, ValueError, KeyError):
+        return ''
+
+
+def is_usable(text, min_chars=50):
+    """
+    Check the text layer could replace the OCR : enough characters, mostly letters and digits.
+    Fonts without unicode mapping give text made of symbols or control characters, it has to be OCRised
+
+    :param text: Text of the page
+    :param min_chars: Minimum number of letters and digits
+    :return: Boolean
+    """
+    chars = [char for char in text if not char.isspace()]
+    alphanumeric = sum(1 for char in chars if char.isalnum())
+    return alphanumeric >= min_chars and alphanumeric >= 0.6 * len(chars)
+
+
+@timed('text_layer')
+def usable_text(file, min_chars=50, page=1):
+    """
+    :return: Text of the page if its text layer is usable, None if the page has to be OCRised
+    """
+    text = page_text(file, page)
+    return text if is_usable(text, min_chars) else None
+
+
+@timed('text_layer_quality')
+def unusable_pages(file, pages):
+    """
+    Find the pages whose text layer is made of symbols or control characters (bad OCR of a scanner, fonts without unicode mapping)
+
+    :param file: Path to the pdf
+    :param pages: Numbers of the pages to check, starting at 1
+    :return: Numbers of the pages with an unusable text layer, empty if the pdf couldn't be read
+    """
+    try:
+        with open(file, 'rb') as pdf_file:
+            pdf = pypdf.PdfReader(pdf_file, strict=False)
+            return [page for page in pages if not is_usable(pdf.pages[page - 1].extract_text() or '', 1)]
+    except (OSError, pypdf.errors.PyPdfError, ValueError, KeyError, IndexError):
+        return []
+
+
+class Coverage:
+    """
+    Text coverage of a PDF, page by page : a page with fonts has a text layer (born-digital or already OCRised),
+    a page without fonts is made of images (scan) or drawings and has to be OCRised
+    """
+    def __init__(self, fonts):
+        """
+        :param fonts: List of Booleans, one for each page, True if the page uses fonts
+        """
+        self.fonts = fonts
+
+    def has_fonts(self, page=1):
+        return page <= len(self.fonts) and self.fonts[page - 1]
+
+    def image_only_pages(self):
+        """
+        :return: Numbers of the pages to OCRise, starting at 1
+        """
+        return [page for page, fonts in enumerate(self.fonts, 1) if not fonts]
+
+    def is_searchable(self):
+        return all(self.fonts)
+
+    def is_scan(self):
+        return not any(self.fonts)
+
+
+def uses_fonts(resources, depth=0):
+    """
+    Look for fonts into the resources of a page, and into the form XObjects it draws
+
+    :param resources: /Resources dictionary
+    :return: Boolean
+    """
+    resources = resources.get_object() if resources is not None else None
+    if not isinstance(resources, pypdf.generic.DictionaryObject):
+        return False
+    font = resources.get('/Font')
+    if font is not None and font.get_object():
+        return True
+    xobjects = resources.get('/XObject')
+    if xobjects is None or depth >= MAX_FORM_DEPTH:
+        return False
+    for reference in xobjects.get_object().values():
+        xobject = reference.get_object()
+        if xobject.get('/Subtype') == '/Form' and uses_fonts(xobject.get('/Resources'), depth + 1):
+            return True
+    return False
+
+
+def plan(coverage, mode='auto', file=None):
+    """
+    Decide how the searchable PDF is created before starting the OCR, so ocrmypdf runs only once :
+    skip : the pages with text are kept as they are, the other ones are OCRised
+    redo : the existing OCR layers are replaced (bad OCR of a scanner)
+    force : all the pages are rasterised and OCRised, when the text layer couldn't be analysed
+    ocrmypdf takes one mode for the document, so in auto mode the pages without text and the pages with an unusable text layer
+    are OCRised in redo mode, the other pages are left as they are
+
+    :param coverage: Class Coverage instance, None if the document isn't a PDF or couldn't be read
+    :param mode: Mode of the config (ocrMode), auto to decide it from the coverage
+    :param file: Path to the pdf, to check the quality of its text layer in auto mode
+    :return: Tuple with the mode and the numbers of the pages to OCRise (None for all the pages, empty for none)
+    """
+    if mode in ('redo', 'force'):
+        return mode, None
+    if coverage is None:
+        return ('skip' if mode == 'skip' else 'force'), None
+    if coverage.is_scan():
+        return 'skip', None
+    pages = coverage.image_only_pages()
+    if mode == 'auto' and file is not None:
+        bad_pages = unusable_pages(file, [page for page in range(1, len(coverage.fonts) + 1) if coverage.has_fonts(page)])
+        if bad_pages:
+            return 'redo', sorted(pages + bad_pages)
+    return 'skip', pages
+
+
+@timed('pdffonts')
+def analyse(file):
+    """
+    Find the pages of PDF using fonts, like pdffonts does, without rendering or extracting the text
+
+    :param file: Path to the pdf
+    :return: Class Coverage instance, or None if the pdf couldn't be read
+    """
+    try:
+        with open(file, 'rb') as pdf_file:
+            pdf = pypdf.PdfReader(pdf_file, strict=False)
+            return Coverage([uses_fonts(page.get('/Resources')) for page in pdf.pages])
+    except (OSError, pypdf.errors.PyPdfError, ValueError, KeyError, AttributeError):
+        return None
@@ -0,0 +1,164 @@
+# This file is part of Open-Capture For MEM Courrier.
+
+# Open-Capture is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# Open-Capture For MEM Courrier is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with Open-Capture For MEM Courrier.  If not, see <https://www.gnu.org/licenses/>.
+
+# @dev : Nathan Cheval <nathan.cheval@outlook.fr>
+
+import os
+import time
+import hashlib
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # inotify_simple is optional, the polling mode is used instead
+    INotify = None
+
+EXTENSIONS_ALLOWED = ('.pdf', '.jpg')
+
+
+class Watcher:
+    def __init__(self, path, log, interval=2, mode='inotify', rescan=60):
+        self.Log = log
+        self.path = path
+        self.sizes = {}
+        self.rescan = rescan
+        self.inotify = None
+        self.interval = interval
+        self.last_scan = 0
+
+        if mode == 'inotify' and INotify is not None:
+            try:
+                self.inotify = INotify()
+                self.inotify.add_watch(path, flags.CLOSE_WRITE | flags.MOVED_TO)
+            except OSError as _e:  # Too many watches, or filesystem without inotify support (NFS, CIFS...)
+                self.Log.error('Unable to use inotify on ' + path + ', fallback on polling : ' + str(_e))
+                self.inotify = None
+        self.mode = 'inotify' if self.inotify else 'poll'
+
+    @staticmethod
+    def is_allowed(file):
+        return os.path.splitext(file)[1].lower() in EXTENSIONS_ALLOWED
+
+    def scan(self, stable_only):
+        """
+        List the watched folder
+
+        :param stable_only: If True, only return the files whose size didn't change since the previous scan
+        :return: List of paths
+        """
+        self.last_scan = time.time()
+        try:
+            files = sorted(os.listdir(self.path))
+        except FileNotFoundError as _e:
+            self.Log.error('Watched folder could not be read : ' + str(_e))
+            return []
+
+        ready = []
+        sizes = {}
+        for file in files:
+            path = os.path.join(self.path, file)
+            if not self.is_allowed(file) or not os.path.isfile(path):
+                continue
+            try:
+                sizes[path] = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            if not stable_only or self.sizes.get(path) == sizes[path]:
+                ready.append(path)
+        self.sizes = sizes
+        return ready
+
+    def poll(self):
+        """
+        Wait for new files. With inotify, files are returned as soon as they are closed after writing or moved in the folder.
+        A complete scan is still done every rescan seconds to catch the files missed (inotify queue overflow, files already there at start)
+
+        :return: List of paths ready to be processed
+        """
+        if self.mode == 'poll':
+            time.sleep(self.interval)
+            return self.scan(True)
+
+        if self.last_scan == 0:
+            return self.scan(False)
+        if time.time() - self.last_scan >= self.rescan:
+            return self.scan(True)
+
+        ready = []
+        for event in self.inotify.read(timeout=int(self.interval * 1000)):
+            if event.mask & flags.Q_OVERFLOW:
+                self.Log.error('Inotify queue overflow, rescan the watched folder')
+                return self.scan(False)
+            if event.name and self.is_allowed(event.name):
+                ready.append(os.path.join(self.path, event.name))
+        return ready
+
+    def backlog(self):
+        """
+        :return: Number of files waiting in the watched folder
+        """
+        try:
+            return len([entry for entry in os.scandir(self.path) if entry.is_file() and self.is_allowed(entry.name)])
+        except FileNotFoundError:
+            return 0
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+
+
+def lease_file_path(lease_path, file):
+    """
+    :return: Path to the lease of a file. The lease is named after the full path of the file, so two watched folders
+             containing the same filename don't block each other
+    """
+    path = os.path.realpath(file)
+    return os.path.join(lease_path, os.path.basename(path) + '-' + hashlib.sha1(path.encode('utf-8')).hexdigest()[:16] + '.lease')
+
+
+def acquire_lease(lease_path, file):
+    """
+    Take a lease on a file, to be sure only one worker of the daemons sharing the lease folder process it.
+    The launch scripts (launch_IN.sh...) use their own locks and don't see these leases.
+    If the process owning the lease is dead, the lease is taken over
+
+    :param lease_path: Folder containing the leases
+    :param file: Path to the file
+    :return: Boolean to show if the lease was acquired
+    """
+    lease = lease_file_path(lease_path, file)
+    for _ in range(2):
+        try:
+            fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            with os.fdopen(fd, 'w') as lease_file:
+                lease_file.write(str(os.getpid()))
+            return True
+        except FileExistsError:
+            try:
+                with open(lease, 'r') as lease_file:
+                    pid = int(lease_file.read() or 0)
+                os.kill(pid, 0)
+                return False
+            except ProcessLookupError:
+                release_lease(lease_path, file)
+            except (ValueError, FileNotFoundError, PermissionError):
+                return False
+    return False
+
+
+def release_lease(lease_path, file):
+    try:
+        os.remove(lease_file_path(lease_path, file))
+    except FileNotFoundError:
+        pass
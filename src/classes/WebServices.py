@@ -21,6 +21,8 @@ import requests
 import holidays
 from datetime import datetime, time, timedelta
 from requests.auth import HTTPBasicAuth
+from . import Metrics
+from .Spans import timed
 
 
 class WebServices:
@@ -32,6 +34,7 @@ class WebServices:
         self.cert = cert_path
         self.check_connection()
 
+    @timed('ws_check_connection')
     def check_connection(self):
         """
         Check if remote host is UP
@@ -43,6 +46,7 @@ class WebServices:
             self.Log.error('More information : ' + str(e))
             raise
 
+    @timed('ws_retrieve_document_by_chrono')
     def retrieve_document_by_chrono(self, chrono_number):
         if chrono_number:
             try:
@@ -61,6 +65,7 @@ class WebServices:
                 self.Log.error('InsertIntoMEMError : ' + str(e))
                 return False, str(e)
 
+    @timed('ws_link_documents')
     def link_documents(self, res_id_master, res_id):
         data = {
             'linkedResources': [res_id]
@@ -73,6 +78,7 @@ class WebServices:
             return False
         return True
 
+    @timed('ws_insert_with_args')
     def insert_with_args(self, file_content, config, subject, date, destination, _process):
         """
         Insert document into MEM Courrier Database
@@ -118,12 +124,14 @@ class WebServices:
         }
 
         try:
+            uploaded = len(data['encodedFile'])
             res = requests.post(self.baseUrl + 'res', auth=self.auth, data=json.dumps(data), headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
 
             if res.status_code != 200:
                 self.Log.error('(' + str(res.status_code) + ') InsertIntoMEMError : ' + str(res.text))
                 return False, str(res.text)
             else:
+                Metrics.inc('opencapture_bytes_uploaded_total', uploaded, endpoint='insert_with_args')
                 data = {
                     'resId': json.loads(res.text)['resId'],
                     'table': 'mlb_coll_ext',
@@ -139,6 +147,7 @@ class WebServices:
             self.Log.error('InsertIntoMEMError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_insert_attachment')
     def insert_attachment(self, file_content, config, res_id, _process):
         """
         Insert attachment into MEM Courrier database
@@ -159,17 +168,20 @@ class WebServices:
         }
 
         try:
+            uploaded = len(data['encodedFile'])
             res = requests.post(self.baseUrl + 'attachments', auth=self.auth, data=json.dumps(data), headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
 
             if res.status_code != 200:
                 self.Log.error('(' + str(res.status_code) + ') InsertAttachmentsIntoMEMError : ' + str(res.text))
                 return False, str(res.text)
             else:
+                Metrics.inc('opencapture_bytes_uploaded_total', uploaded, endpoint='insert_attachment')
                 return res.text
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             self.Log.error('InsertAttachmentsIntoMEMError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_insert_attachment_reconciliation')
     def insert_attachment_reconciliation(self, file_content, chrono, _process, config):
         """
         Insert attachment into MEM Courrier database
@@ -189,17 +201,20 @@ class WebServices:
         }
 
         try:
+            uploaded = len(data['encodedFile'])
             res = requests.post(self.baseUrl + 'reconciliation/add', auth=self.auth, data=json.dumps(data), headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
 
             if res.status_code != 200:
                 self.Log.error('(' + str(res.status_code) + ') InsertAttachmentsReconciliationIntoMEMError : ' + str(res.text))
                 return False, str(res.text)
             else:
+                Metrics.inc('opencapture_bytes_uploaded_total', uploaded, endpoint='insert_attachment_reconciliation')
                 return res.text
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             self.Log.error('InsertAttachmentsReconciliationIntoMEMError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_check_attachment')
     def check_attachment(self, chrono):
         """
         Check if attachment exist
@@ -219,6 +234,7 @@ class WebServices:
             return False, str(e)
 
     # BEGIN OBR01
+    @timed('ws_check_document')
     def check_document(self, chrono):
         """
         Check if document exist
@@ -240,6 +256,7 @@ class WebServices:
             self.Log.error('CheckDocumentError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_reattach_to_document')
     def reattach_to_document(self, res_id_origin, res_id_signed, typist, config):
         """
         Reattach signed document to the origin one
@@ -270,6 +287,7 @@ class WebServices:
             self.Log.error('ReattachToDocumentError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_change_status')
     def change_status(self, res_id, config):
         """
         Change status of a MEM Courrier document
@@ -302,6 +320,7 @@ class WebServices:
             return False, str(e)
     # END OBR01
 
+    @timed('ws_insert_letterbox_from_mail')
     def insert_letterbox_from_mail(self, args, _process):
         """
         Insert mail into MEM Courrier Database
@@ -320,17 +339,20 @@ class WebServices:
             args['customFields'].update(json.loads(_process.get('custom_fields')))
 
         try:
+            uploaded = len(args['encodedFile'])
             res = requests.post(self.baseUrl + 'resources', auth=self.auth, data=json.dumps(args), headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
 
             if res.status_code != 200:
                 self.Log.error('(' + str(res.status_code) + ') MailInsertIntoMEMError : ' + str(res.text))
                 return False, str(res.text)
             else:
+                Metrics.inc('opencapture_bytes_uploaded_total', uploaded, endpoint='insert_letterbox_from_mail')
                 return True, json.loads(res.text)
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             self.Log.error('MailInsertIntoMEMError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_insert_attachment_from_mail')
     def insert_attachment_from_mail(self, args, res_id):
         """
         Insert attachment into MEM Courrier database
@@ -350,12 +372,14 @@ class WebServices:
         }
 
         try:
+            uploaded = len(data['encodedFile'])
             res = requests.post(self.baseUrl + 'attachments', auth=self.auth, data=json.dumps(data), headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
 
             if res.status_code != 200:
                 self.Log.error('(' + str(res.status_code) + ') MailInsertAttachmentsIntoMEMError : ' + str(res.text))
                 return False, str(res.text)
             else:
+                Metrics.inc('opencapture_bytes_uploaded_total', uploaded, endpoint='insert_attachment_from_mail')
                 return True, json.loads(res.text)
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             self.Log.error('MailInsertAttachmentsIntoMEMError : ' + str(e))
@@ -375,6 +399,7 @@ class WebServices:
             process_limit_date += timedelta(days=process_delay)
         return process_limit_date
 
+    @timed('ws_retrieve_entities')
     def retrieve_entities(self):
         try:
             res = requests.get(self.baseUrl + 'entities', auth=self.auth, headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
@@ -387,6 +412,7 @@ class WebServices:
             self.Log.error('RetrieveMEMEntitiesError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_retrieve_doctype')
     def retrieve_doctype(self, doctype):
         try:
             res = requests.get(self.baseUrl + 'doctypes/types/' + doctype, auth=self.auth, headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
@@ -400,6 +426,7 @@ class WebServices:
             self.Log.error('RetrieveDoctypeError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_retrieve_workings_days')
     def retrieve_workings_days(self):
         try:
             res = requests.get(self.baseUrl + 'parameters/workingDays', auth=self.auth, headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
@@ -413,6 +440,7 @@ class WebServices:
             self.Log.error('RetrieveWorkingDaysError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_retrieve_users')
     def retrieve_users(self):
         try:
             res = requests.get(self.baseUrl + 'users', auth=self.auth, headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
@@ -425,6 +453,7 @@ class WebServices:
             self.Log.error('RetrieveMEMUserError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_retrieve_custom_fields')
     def retrieve_custom_fields(self):
         try:
             res = requests.get(self.baseUrl + 'customFields', auth=self.auth, headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
@@ -437,6 +466,7 @@ class WebServices:
             self.Log.error('RetrieveMEMCustomFieldsError : ' + str(e))
             return False, str(e)
 
+    @timed('ws_create_contact')
     def create_contact(self, contact):
         try:
             res = requests.post(self.baseUrl + '/contacts', auth=self.auth, data=json.dumps(contact), headers={'Connection': 'close', 'Content-Type': 'application/json'}, timeout=self.timeout, verify=self.cert)
@@ -16,28 +16,33 @@
 # @dev : Nathan Cheval <nathan.cheval@outlook.fr>
 
 import os
-import re
 import sys
 import time
 import json
 import tempfile
+import threading
+import functools
 
 # useful to use the worker and avoid ModuleNotFoundError
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from kuyruk import Kuyruk
 from src.classes.SMTP import SMTP
 import src.classes.Log as logClass
+import src.classes.Spans as spansClass
+import src.classes.Metrics as metricsClass
 import src.classes.Locale as localeClass
 import src.classes.Images as imagesClass
 import src.classes.Config as configClass
 import src.classes.PyTesseract as ocrClass
-from .process.FindSubject import FindSubject
 import src.classes.Separator as separatorClass
 import src.classes.WebServices as webserviceClass
-from src.process.OCForMEM import process, get_process_name
+from src.classes.Pipeline import Pipeline
+from src.process.OCForMEM import process, process_pj, get_process_name, get_destination, read_document, is_lad_enabled, \
+    ocr_document, find_metadata, make_searchable, send_document
 from src.classes.Mail import move_batch_to_error, send_email_error_pj
 
 OCForMEM = Kuyruk()
+rabbitMQData = {}
 
 if os.path.isfile('./src/config/rabbitMQ.json'):
     with open('./src/config/rabbitMQ.json', 'r') as f:
@@ -54,6 +59,13 @@ if os.path.isfile('./src/config/rabbitMQ.json'):
     if rabbitMQData['vhost'] and rabbitMQData['vhost'] != '/':
         OCForMEM.config.RABBIT_VIRTUAL_HOST = rabbitMQData['vhost']
 
+QUEUE = rabbitMQData.get('queue') or 'kuyruk'
+
+# Shared classes instances of the current worker thread, by configuration files
+worker_resources = threading.local()
+# Log instances of the running tasks, by log file : [Log instance, number of tasks using it]
+task_logs = {'logs': {}, 'lock': threading.Lock()}
+
 
 def str2bool(value):
     """
@@ -64,7 +76,7 @@ def str2bool(value):
     return value.lower() in "true"
 
 
-def check_file(image: imagesClass.Image, path: str, config: configClass.Config, log: logClass.Log) -> bool:
+def check_file(image: imagesClass.Image, path: str, config: configClass.Config, log: logClass.Log, wait: bool = True) -> bool:
     """
     Check integrity of file
 
@@ -72,9 +84,10 @@ def check_file(image: imagesClass.Image, path: str, config: configClass.Config,
     :param path: Path to file
     :param config: Class Config instance
     :param log: Class Log instance
+    :param wait: Boolean to wait until the file is completely written. False for the files written by Open-Capture itself
     :return: Boolean to show if integrity of file is ok or not
     """
-    if not image.check_file_integrity(path, config):
+    if not image.check_file_integrity(path, config, wait):
         log.error('The integrity of file could\'nt be verified : ' + str(path))
         return False
     else:
@@ -114,12 +127,23 @@ def timer(start_time: time.time(), end_time: time.time()):
     return "{:0>2}:{:0>2}:{:05.2f}".format(int(hours), int(minutes), seconds)
 
 
+def is_inserted(res):
+    """
+    Check the result of the process function
+
+    :param res: Result of process or process_file (tuple, False or None)
+    :return: Boolean to show if the document was inserted into MEM Courrier
+    """
+    return isinstance(res, tuple) and res[0] is True
+
+
 def process_file(image, path, config, log, args, separator, ocr, locale, web_service, tmp_folder, config_mail, smtp):
-    if check_file(image, path, config, log):
+    if check_file(image, path, config, log, False):  # Already checked by launch, or written by the separator
         # Process the file and send it to MEM Courrier
         res = process(args, path, log, separator, config, image, ocr, locale, web_service, tmp_folder, config_mail)
         if args.get('isMail') is not None and args.get('isMail') is True:
             # Process the attachments of mail
+            metricsClass.document_done(args['process'], res[0])
             if res[0]:
                 res_id = res[1]['resId']
                 if len(args['attachments']) > 0:
@@ -146,16 +170,22 @@ def process_file(image, path, config, log, args, separator, ocr, locale, web_ser
             return res
 
 
-# @OCForMEM.task()
-def launch(args):
-    start = time.time()
-    # Init all the necessary classes
+def init_resources(args, log=None):
+    """
+    Build all the classes which doesn't depend on the processed file (Config, Log, Locale, PyTesseract, WebServices...)
+    They could be built once and shared between many calls of launch (daemon or batch mode)
+
+    :param args: Arguments of the launch (config, config_mail, log...)
+    :param log: Class Log instance to use. If None, it is built from the log file of the mail batch or of the config
+    :return: Dict containing all the shared classes instances
+    """
     config = configClass.Config()
     config.load_file(args['config'])
+    metricsClass.configure(config)
     smtp = False
 
     if args.get('isMail') is not None and args['isMail'] in [True, 'attachments']:
-        log = logClass.Log(args['log'])
+        log = log or logClass.Log(args['log'])
         config_mail = configClass.Config()
         config_mail.load_file(args['config_mail'])
         smtp = SMTP(
@@ -171,14 +201,10 @@ def launch(args):
             config_mail.cfg['GLOBAL']['smtp_auth'],
             config_mail.cfg['GLOBAL']['smtp_from_mail'],
         )
-        if args['isMail'] is True:
-            log.info('Process email n°' + args['cpt'] + '/' + args['nb_of_mail'] + ' with UID : ' + args['msg_uid'])
     else:
-        log = logClass.Log(config.cfg['GLOBAL']['logfile'])
+        log = log or logClass.Log(config.cfg['GLOBAL']['logfile'])
         config_mail = False
 
-    tmp_folder = tempfile.mkdtemp(dir=config.cfg['GLOBAL']['tmppath'])
-    filename = tempfile.NamedTemporaryFile(dir=tmp_folder).name + '.jpg'
     locale = localeClass.Locale(config)
     ocr = ocrClass.PyTesseract(locale.localeOCR, log, config)
     web_service = webserviceClass.WebServices(
@@ -190,6 +216,45 @@ def launch(args):
         config.cfg['OCForMEM']['certpath']
     )
 
+    return {
+        'log': log,
+        'ocr': ocr,
+        'smtp': smtp,
+        'config': config,
+        'locale': locale,
+        'config_mail': config_mail,
+        'web_service': web_service
+    }
+
+
+def launch(args, resources=None):
+    """
+    Process a file (or an e-mail) and send it to MEM Courrier
+
+    :param args: Arguments of the launch (file, config, process...)
+    :param resources: Shared classes instances built by init_resources. If None, they are built for this file only
+    :return: Boolean to show if the file was inserted into MEM Courrier (e-mails are reported with their batch log)
+    """
+    start = time.time()
+    # Init all the necessary classes, or reuse the ones given by the daemon or batch mode
+    if resources is None:
+        resources = init_resources(args)
+
+    log = resources['log']
+    ocr = resources['ocr']
+    smtp = resources['smtp']
+    config = resources['config']
+    locale = resources['locale']
+    config_mail = resources['config_mail']
+    web_service = resources['web_service']
+    ocr.text = ''  # Avoid to reuse the text of the previous file if the PyTesseract instance is shared
+
+    if args.get('isMail') is not None and args['isMail'] is True:
+        log.info('Process email n°' + args['cpt'] + '/' + args['nb_of_mail'] + ' with UID : ' + args['msg_uid'])
+
+    tmp_folder = tempfile.mkdtemp(dir=config.cfg['GLOBAL']['tmppath'])
+    filename = tempfile.NamedTemporaryFile(dir=tmp_folder).name + '.jpg'
+
     image = imagesClass.Images(
         filename,
         int(config.cfg['GLOBAL']['resolution']),
@@ -201,45 +266,295 @@ def launch(args):
     # Start process
     _process = get_process_name(args, config)
     args['process_name'] = _process
+    spans = spansClass.start_document(args.get('file') or args.get('msg_uid'), _process)
     separator = separatorClass.Separator(log, config, tmp_folder, _process)
+    image.page_cache = separator.page_cache  # Pages rendered by the separator are reused by the OCR
 
     if args.get('isMail') is None or args.get('isMail') is False:
         separator.enabled = str2bool(config.cfg[_process]['separator_qr'])
 
+    inserted = False
     if args.get('file') is not None:
         path = args['file']
-        if check_file(image, path, config, log):
+        if check_file(image, path, config, log, not args.get('isMail')):  # E-mails and attachments are written by MailCollect before
             if separator.enabled:
                 separator.run(path)
                 if separator.error:  # in case the file is not a pdf or no qrcode was found, process as an image
-                    process(args, path, log, separator, config, image, ocr, locale, web_service, tmp_folder)
+                    res = process(args, path, log, separator, config, image, ocr, locale, web_service, tmp_folder)
+                    inserted = is_inserted(res)
                 else:
+                    inserted = True
                     for file in separator.pdf_list:
                         res = process_file(image, file, config, log, args, separator, ocr, locale, web_service, tmp_folder, config_mail, smtp)
-                        if res[0]:
+                        if not is_inserted(res):
+                            inserted = False
+                        else:
                             res = json.loads(res[1])
                             if 'resId' in res:
-                                res_id = res['resId']
-                                for pj in separator.pj_list:
-                                    document_filename = os.path.basename(file)
-                                    pj_filename = re.sub(r"#\d", "", os.path.basename(pj).replace('PJ_', ''))
-                                    if pj_filename == document_filename:
-                                        image.pdf_to_jpg(pj, True)
-                                        ocr.text_builder(image.img)
-                                        subject_thread = FindSubject(ocr.text, locale, log)
-                                        subject_thread.start()
-                                        subject_thread.join()
-                                        pj_args = {
-                                            'file': pj,
-                                            'format': 'pdf',
-                                            'status': 'A_TRA',
-                                            'subject': subject_thread.subject
-                                        }
-                                        res = web_service.insert_attachment_from_mail(pj_args, res_id)
-                                        if res:
-                                            log.info('Attachment inserted : ' + str(res))
+                                process_pj(file, res['resId'], separator, image, ocr, locale, web_service, log)
             else:
-                process_file(image, path, config, log, args, separator, ocr, locale, web_service, tmp_folder, config_mail, smtp)
+                res = process_file(image, path, config, log, args, separator, ocr, locale, web_service, tmp_folder, config_mail, smtp)
+                inserted = is_inserted(res)
+    separator.page_cache.clear()
     recursive_delete([tmp_folder, separator.output_dir, separator.output_dir_pdfa], log)
+    spansClass.end_document(spans, config.cfg['GLOBAL'].get('spansfile'), inserted)
+    if args.get('isMail') is not True:  # E-mails are counted by process_file, attachments here
+        metricsClass.document_done(_process, inserted)
     end = time.time()
     log.info('Process end after ' + timer(start, end) + '\n')
+    return inserted
+
+
+def new_document(source, file, tmp_folder, image, resources):
+    """
+    Build the context of a document going through the pipeline. Each document has its own Images and PyTesseract
+    instances (they keep the state of the current file) and its own temporary folder
+
+    :param source: Context of the file given to the pipeline (the document could be one part of it, if separated)
+    """
+    return {
+        'file': file,
+        'image': image,
+        'source': source,
+        'tmp_folder': tmp_folder,
+        'args': source['args'],
+        'split': file != source['path'],
+        'ocr': ocrClass.PyTesseract(resources['locale'].localeOCR, resources['log'], resources['config'])
+    }
+
+
+def new_image(tmp_folder, config, log, page_cache):
+    image = imagesClass.Images(
+        tempfile.NamedTemporaryFile(dir=tmp_folder).name + '.jpg',
+        int(config.cfg['GLOBAL']['resolution']),
+        int(config.cfg['GLOBAL']['compressionquality']),
+        log,
+        config
+    )
+    image.page_cache = page_cache
+    return image
+
+
+def pipeline_rasterise(resources, source):
+    """
+    First stage : check the file, separate it if needed and convert the first page of each document to image
+    """
+    log = resources['log']
+    config = resources['config']
+    args = source['args']
+    _process = args['process_name']
+    spansClass.set_current(source['spans'])
+
+    tmp_folder = tempfile.mkdtemp(dir=config.cfg['GLOBAL']['tmppath'])
+    source['tmp_folders'].append(tmp_folder)
+    separator = separatorClass.Separator(log, config, tmp_folder, _process)
+    image = new_image(tmp_folder, config, log, separator.page_cache)
+    separator.enabled = str2bool(config.cfg[_process]['separator_qr'])
+    source['separator'] = separator
+
+    if not check_file(image, source['path'], config, log):
+        source['inserted'] = False
+        return pipeline_finish(resources, source)
+
+    documents = []
+    if separator.enabled:
+        separator.run(source['path'])
+    if separator.enabled and not separator.error:
+        for file in separator.pdf_list:
+            if not check_file(image, file, config, log, False):
+                source['inserted'] = False
+                continue
+            document_tmp_folder = tempfile.mkdtemp(dir=config.cfg['GLOBAL']['tmppath'])
+            source['tmp_folders'].append(document_tmp_folder)
+            documents.append(new_document(source, file, document_tmp_folder, new_image(document_tmp_folder, config, log, separator.page_cache), resources))
+    else:  # in case the file is not a pdf or no qrcode was found, process as an image
+        documents.append(new_document(source, source['path'], tmp_folder, image, resources))
+
+    if not documents:
+        return pipeline_finish(resources, source)
+
+    source['pending'] = len(documents)
+    for document in documents:
+        log.info('Processing file : ' + document['file'])
+        document['destination'] = get_destination(args, document['file'], separator, config, _process, log)
+        document['is_ocr'] = read_document(document['file'], document['image'], document['ocr'])
+    return documents
+
+
+def pipeline_ocr(resources, document):
+    """
+    Second stage : OCR the first page and create the searchable PDF
+    """
+    args = document['args']
+    spansClass.set_current(document['source']['spans'])
+    if is_lad_enabled(resources['config'], args['process_name']):
+        ocr_document(args, document['file'], document['image'], document['ocr'], resources['log'], document['is_ocr'], document['tmp_folder'], document['source']['separator'])
+    document['file'], document['file_to_send'] = make_searchable(args, document['file'], document['is_ocr'], document['image'], document['ocr'],
+                                                                 document['tmp_folder'], document['source']['separator'], resources['log'])
+    return document
+
+
+def pipeline_extract(resources, document):
+    """
+    Third stage : find the date, the subject and the chrono number
+    """
+    args = document['args']
+    spansClass.set_current(document['source']['spans'])
+    document['date'] = document['subject'] = document['chrono_number'] = ''
+    if is_lad_enabled(resources['config'], args['process_name']):
+        document['date'], document['subject'], document['chrono_number'] = find_metadata(args, document['ocr'], resources['locale'], resources['log'], resources['config'],
+                                                                                          resources['config_mail'], args['process_name'], document['image'])
+    return document
+
+
+def pipeline_upload(resources, document):
+    """
+    Last stage : send the document to MEM Courrier, with its attachments found by the separator
+    """
+    log = resources['log']
+    source = document['source']
+    spansClass.set_current(source['spans'])
+    res = send_document(document['args'], document['file'], document['file_to_send'], document['date'], document['subject'], document['chrono_number'],
+                        document['destination'], log, resources['config'], resources['config_mail'], resources['web_service'])
+    if not is_inserted(res):
+        source['inserted'] = False
+    elif document['split']:
+        res = json.loads(res[1])
+        if 'resId' in res:
+            process_pj(document['file'], res['resId'], source['separator'], document['image'], document['ocr'], resources['locale'], resources['web_service'], log)
+    pipeline_document_done(resources, document)
+
+
+def pipeline_document_done(resources, document):
+    source = document['source']
+    with source['lock']:
+        source['pending'] -= 1
+        last = source['pending'] == 0
+    if last:
+        pipeline_finish(resources, source)
+
+
+def pipeline_finish(resources, source):
+    """
+    Called once all the documents of a file are done : delete the temporary files and store the result
+    """
+    folders = list(source['tmp_folders'])
+    if source.get('separator'):
+        source['separator'].page_cache.clear()
+        folders += [source['separator'].output_dir, source['separator'].output_dir_pdfa]
+    recursive_delete(folders, resources['log'])
+    spansClass.end_document(source['spans'], resources['config'].cfg['GLOBAL'].get('spansfile'), source['inserted'] and source['error'] is None, source['error'])
+    metricsClass.document_done(source['args']['process_name'], source['inserted'] and source['error'] is None)
+    source['results'].append({
+        'path': source['path'],
+        'error': source['error'],
+        'inserted': source['inserted'] and source['error'] is None,
+        'duration': time.time() - source['start']
+    })
+
+
+def pipeline_error(resources, item, error):
+    if 'source' in item:  # A document failed after the first stage
+        item['source']['error'] = str(error)
+        pipeline_document_done(resources, item)
+    else:
+        item['error'] = str(error)
+        pipeline_finish(resources, item)
+
+
+def launch_pipeline(files, args, resources):
+    """
+    Process many files through a pipeline : rasterise, OCR, extract and upload stages run at the same time on different files.
+    The number of threads of each stage and the size of the queues between them are set in the PIPELINE section of the config
+
+    :param files: List of paths
+    :param args: Arguments of the launch, without the file
+    :param resources: Shared classes instances built by init_resources
+    :return: List of results, one per file (see Daemon.process_in_worker)
+    """
+    config = resources['config']
+    pipeline_cfg = config.cfg.get('PIPELINE', {})
+    results = []
+
+    def sources():
+        for path in files:
+            source_args = dict(args)
+            source_args['file'] = path
+            source_args['process_name'] = get_process_name(source_args, config)
+            yield {
+                'path': path,
+                'error': None,
+                'pending': 0,
+                'inserted': True,
+                'separator': None,
+                'tmp_folders': [],
+                'args': source_args,
+                'results': results,
+                'start': time.time(),
+                'lock': threading.Lock(),
+                'spans': spansClass.Document(path, source_args['process_name'])
+            }
+
+    Pipeline([
+        ('rasterise', functools.partial(pipeline_rasterise, resources), pipeline_cfg.get('rasterworkers', 1)),
+        ('ocr', functools.partial(pipeline_ocr, resources), pipeline_cfg.get('ocrworkers', 2)),
+        ('extract', functools.partial(pipeline_extract, resources), pipeline_cfg.get('extractworkers', 1)),
+        ('upload', functools.partial(pipeline_upload, resources), pipeline_cfg.get('uploadworkers', 2))
+    ], resources['log'], int(pipeline_cfg.get('queuesize', 4)), functools.partial(pipeline_error, resources)).run(sources())
+    return results
+
+
+@OCForMEM.task(queue=QUEUE)
+def launch_task(args):
+    """
+    Kuyruk task, consumed by the queue workers (see launch_worker_queue.py)
+    Config, Locale, PyTesseract and WebServices are built once by worker thread and configuration
+
+    :param args: Same arguments as launch
+    """
+    if not hasattr(worker_resources, 'cache'):
+        worker_resources.cache = {}
+
+    key = (args['config'], args.get('config_mail'))
+    resources = worker_resources.cache.get(key)
+
+    # Each mail batch has its own log file
+    if args.get('isMail') is not None and args['isMail'] in [True, 'attachments']:
+        log_path = args['log']
+    elif resources is not None:
+        log_path = resources['config'].cfg['GLOBAL']['logfile']
+    else:
+        config = configClass.Config()
+        config.load_file(args['config'])
+        log_path = config.cfg['GLOBAL']['logfile']
+
+    log = acquire_task_log(log_path)
+    try:
+        if resources is None:
+            resources = worker_resources.cache[key] = init_resources(args, log)
+        else:
+            resources['log'] = resources['ocr'].Log = resources['web_service'].Log = log
+        launch(args, resources)
+    finally:
+        release_task_log(log_path)
+
+
+def acquire_task_log(log_path):
+    """
+    The tasks of a worker run at the same time, each one writes into its log file through its own logger
+
+    :param log_path: Path to the log file of the task
+    :return: Class Log instance, shared by the tasks using the same log file
+    """
+    with task_logs['lock']:
+        if log_path not in task_logs['logs']:
+            task_logs['logs'][log_path] = [logClass.Log(log_path, 'Open-Capture:' + log_path), 0]
+        task_logs['logs'][log_path][1] += 1
+        return task_logs['logs'][log_path][0]
+
+
+def release_task_log(log_path):
+    with task_logs['lock']:
+        task_logs['logs'][log_path][1] -= 1
+        if task_logs['logs'][log_path][1] == 0:
+            task_logs['logs'].pop(log_path)[0].close()
@@ -17,11 +17,13 @@
 
 import re
 from threading import Thread
+import src.classes.Spans as spansClass
 
 
 class FindChrono(Thread):
     def __init__(self, text, process):
         Thread.__init__(self, name='chronoThread')
+        self.spans = spansClass.current()
         self.text = text
         self.chrono = None
         self.process = process
@@ -32,5 +34,6 @@ class FindChrono(Thread):
         This will search for a chrono number into the text of original PDF
 
         """
-        for _chrono in re.finditer(r"" + self.process['chronoregex'] + "", self.text):
-            self.chrono = _chrono.group()
+        with spansClass.span('find_chrono', self.spans):
+            for _chrono in re.finditer(r"" + self.process['chronoregex'] + "", self.text):
+                self.chrono = _chrono.group()
@@ -17,12 +17,14 @@
 
 import re
 from threading import Thread
+import src.classes.Spans as spansClass
 from datetime import datetime
 
 
 class FindDate(Thread):
     def __init__(self, text, locale, log, config):
         Thread.__init__(self, name='dateThread')
+        self.spans = spansClass.current()  # Spans of the document processed by the thread creating this one
         self.Log = log
         self.date = ''
         self.text = text
@@ -69,12 +71,13 @@ class FindDate(Thread):
         This will search for a date into the text of original PDF
 
         """
-        for _date in re.finditer(r"" + self.Locale.regexDate + "", re.sub(r'(\d)\s+(\d)', r'\1\2', self.text)):  # The re.sub is useful to fix space between numerics
-            if self.format_date(_date):
-                return True
-
-        if not self.date:
-            for _date in re.finditer(r"" + self.Locale.regexDate + "", self.text):
+        with spansClass.span('find_date', self.spans):
+            for _date in re.finditer(r"" + self.Locale.regexDate + "", re.sub(r'(\d)\s+(\d)', r'\1\2', self.text)):  # The re.sub is useful to fix space between numerics
                 if self.format_date(_date):
                     return True
 
+            if not self.date:
+                for _date in re.finditer(r"" + self.Locale.regexDate + "", self.text):
+                    if self.format_date(_date):
+                        return True
+
@@ -17,11 +17,13 @@
 
 import re
 from threading import Thread
+import src.classes.Spans as spansClass
 
 
 class FindSubject(Thread):
     def __init__(self, text, locale, log):
         Thread.__init__(self, name='subjectThread')
+        self.spans = spansClass.current()
         self.Log = log
         self.text = text
         self.subject = None
@@ -33,30 +35,31 @@ class FindSubject(Thread):
         This will search for a subject into the text of original PDF
 
         """
-        subject_array = []
-        for _subject in re.finditer(r"" + self.Locale.regexSubject + "", self.text):
-            if len(_subject.group()) > 3:
-                # Using the [:-2] to delete the ".*" of the regex
-                # Useful to keep only the subject and delete the left part (e.g : remove "Objet : " from "Objet : Candidature pour un emploi - Démo Salindres")
-                subject_array.append(_subject.group())
+        with spansClass.span('find_subject', self.spans):
+            subject_array = []
+            for _subject in re.finditer(r"" + self.Locale.regexSubject + "", self.text):
+                if len(_subject.group()) > 3:
+                    # Using the [:-2] to delete the ".*" of the regex
+                    # Useful to keep only the subject and delete the left part (e.g : remove "Objet : " from "Objet : Candidature pour un emploi - Démo Salindres")
+                    subject_array.append(_subject.group())
 
-        # If there is more than one subject found, prefer the "Object" one instead of "Ref"
-        if len(subject_array) > 1:
-            subject = loop_find_subject(subject_array, self.Locale.subjectOnly)
-            if subject:
-                self.subject = re.sub(r"^" + self.Locale.regexSubject[:-2] + "", '', subject).strip()
-            else:
-                subject = loop_find_subject(subject_array, self.Locale.refOnly)
+            # If there is more than one subject found, prefer the "Object" one instead of "Ref"
+            if len(subject_array) > 1:
+                subject = loop_find_subject(subject_array, self.Locale.subjectOnly)
                 if subject:
                     self.subject = re.sub(r"^" + self.Locale.regexSubject[:-2] + "", '', subject).strip()
-        elif len(subject_array) == 1:
-            self.subject = re.sub(r"^" + self.Locale.regexSubject[:-2] + "", '', subject_array[0]).strip()
-        else:
-            self.subject = ''
+                else:
+                    subject = loop_find_subject(subject_array, self.Locale.refOnly)
+                    if subject:
+                        self.subject = re.sub(r"^" + self.Locale.regexSubject[:-2] + "", '', subject).strip()
+            elif len(subject_array) == 1:
+                self.subject = re.sub(r"^" + self.Locale.regexSubject[:-2] + "", '', subject_array[0]).strip()
+            else:
+                self.subject = ''
 
-        if self.subject != '':
-            self.search_subject_second_line()
-            self.Log.info("Find the following subject : " + self.subject)
+            if self.subject != '':
+                self.search_subject_second_line()
+                self.Log.info("Find the following subject : " + self.subject)
 
     def search_subject_second_line(self):
         not_allowed_symbol = [':', '.']
@@ -16,13 +16,21 @@
 # @dev : Nathan Cheval <nathan.cheval@outlook.fr>
 
 import os
+import re
 import sys
+import copy
 import json
 import shutil
 from .FindDate import FindDate
 from .OCForForms import process_form
 from .FindSubject import FindSubject
 from .FindChrono import FindChrono
+from concurrent.futures import ThreadPoolExecutor
+import src.classes.Spans as spansClass
+import src.classes.Metrics as metricsClass
+import src.classes.OcrZones as ocrZonesClass
+import src.classes.Preprocess as preprocessClass
+import src.classes.TextLayer as textLayerClass
 
 
 def get_process_name(args, config):
@@ -37,13 +45,12 @@ def get_process_name(args, config):
     return _process
 
 
-def process(args, file, log, separator, config, image, ocr, locale, web_service, tmp_folder, config_mail=None):
-    log.info('Processing file : ' + file)
-
-    # Check if the choosen process mode if available. If not take the default one
-    _process = args['process_name']
-    log.info('Using the following process : ' + _process)
+def get_destination(args, file, separator, config, _process, log):
+    """
+    Find the destination of the document : from the filename (RDFF), the arguments, the e-mail or the default one
 
+    :return: Destination of the document
+    """
     destination = ''
 
     # Check if RDFF is enabled, if yes : retrieve the service ID from the filename
@@ -68,27 +75,40 @@ def process(args, file, log, separator, config, image, ocr, locale, web_service,
         destination = config.cfg[_process]['destination']
         log.info("Destination can't be found, using default destination : " + destination)
 
-    if args.get('isMail') is not None and args.get('isMail') is True:
-        if args['isForm']:
-            log.info('Start searching form into e-mail')
-            form = process_form(args, config, config_mail, log, web_service, _process, file)
-            if form and form[1] != 'default':
-                return form
-
-    if os.path.splitext(file)[1].lower() == '.pdf':  # Open the pdf and convert it to JPG
-        res = image.pdf_to_jpg(file, True)
-        if res is False:
+    return destination
+
+
+def read_document(file, image, ocr):
+    """
+    Open the document : read the text layer of the first page of PDF, or convert it to image if it has to be OCRised,
+    read the text of HTML or TXT, or open the picture
+
+    :param file: Path to the document
+    :param image: Class Images instance
+    :param ocr: Class PyTesseract instance
+    :return: Boolean to show if the document is already searchable (no need to OCR it before sending it)
+    """
+    image.img = None  # No image means the text doesn't need the OCR
+    ocr.mode, ocr.pages = 'skip', None
+    ocr.tier = None
+    ocr.field_text = {}
+    ocr.page_texts = []
+    ocr.searchablePdf = ''
+    if os.path.splitext(file)[1].lower() == '.pdf':
+        coverage = textLayerClass.analyse(file)
+        text = None
+        if coverage is not None and coverage.has_fonts(1):  # Without fonts, the first page has no text layer to read
+            text = textLayerClass.usable_text(file, int(image.config['GLOBAL'].get('textlayerminchars') or 50))
+        if text is not None:
+            ocr.text = text
+        elif image.pdf_to_jpg(file, True) is False:
             exit(os.EX_IOERR)
-        # Check if pdf is already OCR and searchable
-        check_ocr = os.popen('pdffonts ' + file, 'r')
-        tmp = ''
-        for line in check_ocr:
-            tmp += line
-
-        if len(tmp.split('\n')) > 3:
-            is_ocr = True
-        else:
-            is_ocr = False
+        # Check if pdf is already OCR and searchable. If only some pages are, only the others will be OCRised
+        is_ocr = coverage is not None and coverage.is_searchable()
+        ocr_mode = image.config['GLOBAL'].get('ocrmode') or 'auto'
+        if not is_ocr or ocr_mode == 'auto':  # In auto mode, the pages of a searchable PDF with an unusable text layer are OCRised again
+            ocr.mode, ocr.pages = textLayerClass.plan(coverage, ocr_mode, file)
+            is_ocr = ocr.pages == []
     elif os.path.splitext(file)[1].lower() == '.html':
         res = image.html_to_txt(file)
         if res is False:
@@ -102,94 +122,255 @@ def process(args, file, log, separator, config, image, ocr, locale, web_service,
         image.open_img(file)
         is_ocr = False
 
-    if 'reconciliation' not in _process and config.cfg['GLOBAL']['disablelad'] == 'False':
-        # Get the OCR of the file as a string content
-        if args.get('isMail') is None or args.get('isMail') is False and os.path.splitext(file)[1].lower() not in ('.html', '.txt'):
-            ocr.text_builder(image.img)
-
-        # Find subject of document
-        if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_subject') is True:
-            subject_thread = ''
-        else:
-            subject_thread = FindSubject(ocr.text, locale, log)
-
-        if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and 'chronoregex' not in config_mail.cfg[_process]:
-            chrono_thread = ''
-        elif args.get('isMail') is not None and args.get('isMail') in [True] and 'chronoregex' in config_mail.cfg[_process] and config_mail.cfg[_process]['chronoregex']:
-            chrono_thread = FindChrono(ocr.text, config_mail.cfg[_process])
-        elif _process in config.cfg and 'chronoregex' in config.cfg[_process] and config.cfg[_process]['chronoregex']:
-            chrono_thread = FindChrono(ocr.text, config.cfg[_process])
-        else:
-            chrono_thread = ''
-
-        # Find date of document
-        if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_date') is True:
-            date_thread = ''
-        else:
-            date_thread = FindDate(ocr.text, locale, log, config)
-
-        # Launch all threads
-        if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_date') is True):
-            date_thread.start()
-        if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_subject') is True):
-            subject_thread.start()
-        if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments']) and 'chronoregex' in config.cfg[_process] and config.cfg[_process]['chronoregex']:
-            chrono_thread.start()
-        elif args.get('isMail') is not None and args.get('isMail') in [True] and 'chronoregex' in config_mail.cfg[_process] and config_mail.cfg[_process]['chronoregex']:
-            chrono_thread.start()
-
-        # Wait for end of threads
-        if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_date') is True):
-            date_thread.join()
-        if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_subject') is True):
-            subject_thread.join()
-        if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments']) and 'chronoregex' in config.cfg[_process] and config.cfg[_process]['chronoregex']:
-            chrono_thread.join()
-        elif args.get('isMail') is not None and args.get('isMail') in [True] and 'chronoregex' in config_mail.cfg[_process] and config_mail.cfg[_process]['chronoregex']:
-            chrono_thread.join()
-
-        # Get the returned values
-        if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_date') is True):
-            date = date_thread.date
-        else:
-            date = ''
-
-        if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and 'chronoregex' not in config_mail.cfg[_process]:
-            chrono_number = ''
-        elif args.get('isMail') is not None and args.get('isMail') in [True] and 'chronoregex' in config_mail.cfg[_process] and config_mail.cfg[_process]['chronoregex']:
-            chrono_number = chrono_thread.chrono
-        elif _process in config.cfg and 'chronoregex' in config.cfg[_process] and config.cfg[_process]['chronoregex']:
-            chrono_number = chrono_thread.chrono
+    return is_ocr
+
+
+def is_lad_enabled(config, _process):
+    return 'reconciliation' not in _process and config.cfg['GLOBAL']['disablelad'] == 'False'
+
+
+def is_single_pass(image, ocr, is_ocr):
+    """
+    The first page is OCRised only once if it is OCRised anyway to create the searchable PDF : its text is read from the result
+    """
+    return is_ocr is False and image.config['GLOBAL'].get('singlepassocr') == 'True' and (not ocr.pages or 1 in ocr.pages)
+
+
+def ocr_document(args, file, image, ocr, log, is_ocr=True, tmp_folder=None, separator=None):
+    """
+    OCR the first page of the document, if its text wasn't read directly (HTML, TXT).
+    If the document isn't searchable, the searchable PDF is created at the same time and its text is used
+
+    :param is_ocr: Boolean returned by read_document, False if the searchable PDF has to be created
+    :param tmp_folder: Temporary folder of the document, for the searchable PDF
+    :param separator: Class Separator instance
+    """
+    # Get the OCR of the file as a string content
+    if args.get('isMail') is None or args.get('isMail') is False and os.path.splitext(file)[1].lower() not in ('.html', '.txt'):
+        if image.img is None:
+            log.info('Text read from the text layer of the PDF, no OCR needed')
+            return
+        if tmp_folder is not None and is_single_pass(image, ocr, is_ocr):
+            log.info('Start OCR on document, the text of the first page is read from the searchable PDF' + (' (pages ' + ','.join(str(page) for page in ocr.pages) + ')' if ocr.pages else ''))
+            ocr.generate_searchable_pdf(file, tmp_folder, separator)
+            # ocrmypdf writes a placeholder instead of the text of the pages it skipped (text already there)
+            if ocr.searchablePdf and ocr.page_texts and not ocr.page_texts[0].lstrip().startswith('[OCR skipped on page(s)'):
+                ocr.text = ocr.page_texts[0]
+                return
+        try:
+            zones = ocrZonesClass.settings(image.config, args.get('process_name'))
+        except ValueError as _e:
+            log.error('Wrong ocrZones, the full page will be OCRised : ' + str(_e))
+            zones = {}
+        if zones:
+            ocr_zones(image, ocr, zones, args.get('process_name'), log)
         else:
-            chrono_number = ''
+            ocr_page(image, ocr, args.get('process_name'), log)
+
+
+def ocr_tiers(cfg, process=None):
+    """
+    :param cfg: Content of the config (Config.cfg)
+    :param process: Name of the process section, its options replace the ones of the GLOBAL section
+    :return: Tuple with the resolution of the fast OCR (0 if disabled) and the minimal confidence to keep its text
+    """
+    section = cfg.get(process) or {}
+    fast_dpi = section.get('fastocrresolution', cfg['GLOBAL'].get('fastocrresolution', ''))
+    min_confidence = section.get('ocrminconfidence') or cfg['GLOBAL'].get('ocrminconfidence') or 80
+    return int(fast_dpi or 0), float(min_confidence)
+
+
+def ocr_page(image, ocr, _process, log):
+    """
+    OCR the full first page. With fastOcrResolution, a downscaled copy is OCRised first and its text is kept if tesseract is confident enough.
+    Otherwise, or if find_metadata doesn't find the date or the subject into it, the page is OCRised at full resolution
+    """
+    fast_dpi, min_confidence = ocr_tiers(image.config, _process)
+    dpi = resolution(image, image.img)
+    if not fast_dpi or fast_dpi >= dpi:
+        ocr_full_page(image, ocr, _process, 'direct', log)
+        return
+    with spansClass.span('ocr_fast') as details:
+        ocr.text_builder(preprocess_image(image, _process, log, image.downscale(image.img, dpi, fast_dpi)))
+        details.update({'dpi': fast_dpi, 'confidence': ocr.confidence})
+    metricsClass.inc('opencapture_ocr_tier_total', tier='fast')
+    if ocr.confidence is not None and ocr.confidence >= min_confidence:
+        ocr.tier = 'fast'
+        return
+    log.info('Confidence of the OCR at ' + str(fast_dpi) + ' DPI too low (' + str(ocr.confidence if ocr.confidence is None else round(ocr.confidence, 1)) + '), OCR at full resolution')
+    ocr_full_page(image, ocr, _process, 'confidence', log)
+
+
+def ocr_full_page(image, ocr, _process, reason, log):
+    """
+    :param reason: Why the page is OCRised at full resolution : direct (no fast OCR), confidence (of the fast OCR), fields (not found)
+    """
+    with spansClass.span('ocr_full') as details:
+        ocr.text_builder(preprocess_image(image, _process, log))
+        details.update({'reason': reason, 'confidence': ocr.confidence})
+    metricsClass.inc('opencapture_ocr_tier_total', tier='full', reason=reason)
+    ocr.tier = 'full'
+
+
+def ocr_zones(image, ocr, zones, _process, log):
+    """
+    OCR only the zones of the first page where the date, the subject and the chrono number are searched.
+    A zone shared by many fields is OCRised once. find_metadata OCRises the full page if nothing is found into them
+
+    :param zones: Dict with the zone of each field (left, top, right, bottom in fraction of the page)
+    """
+    zone_texts = {}
+    for roi in dict.fromkeys(zones.values()):
+        ocr.text_builder(preprocess_image(image, _process, log, image.crop(image.img, roi)))
+        zone_texts[roi] = ocr.text
+    ocr.field_text = ocrZonesClass.texts(zones, zone_texts)
+    ocr.text = '\n'.join(zone_texts.values())
+    log.info('OCR of the zones only : ' + ', '.join(field + ' ' + str(roi) for field, roi in zones.items()))
+
+
+def resolution(image, img):
+    """
+    :param image: Class Images instance
+    :param img: PIL Image of the page
+    :return: Resolution of :img. Rendered pages have none and images often carry a wrong one (72 DPI), the config one is used then
+    """
+    dpi = img.info.get('dpi', (0,))[0]
+    return dpi if dpi >= 150 else image.resolution
+
+
+def preprocess_image(image, _process, log, img=None):
+    """
+    Prepare the page for the OCR (deskew, binarise, trim, downscale), with the options of the process section or of the GLOBAL section
+
+    :param image: Class Images instance, with the page opened
+    :param img: PIL Image to prepare, a zone of the page for example. If None, the page opened
+    :return: PIL Image to OCR
+    """
+    img = image.img if img is None else img
+    steps, ocr_resolution = preprocessClass.settings(image.config, _process)
+    if not steps:
+        return img
+    dpi = resolution(image, img)
+    img, effects = preprocessClass.run(img, steps, dpi, ocr_resolution)
+    log.info('Preprocessing before OCR : ' + preprocessClass.describe(effects))
+    return img
+
+
+def find_metadata(args, ocr, locale, log, config, config_mail, _process, image=None):
+    """
+    Search the date, the subject and the chrono number into the text of the document, in parallel.
+    If only the OCR zones were OCRised, each field is searched into its zone, then into the full page if the date or the subject wasn't found
+
+    :param image: Class Images instance, with the page opened, to OCRise the full page if needed
+    :return: Tuple with the date, the subject and the chrono number ('' if not found)
+    """
+    # Find subject of document
+    if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_subject') is True:
+        subject_thread = ''
+    else:
+        subject_thread = FindSubject(ocr.field_text.get('subject', ocr.text), locale, log)
+
+    if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and 'chronoregex' not in config_mail.cfg[_process]:
+        chrono_thread = ''
+    elif args.get('isMail') is not None and args.get('isMail') in [True] and 'chronoregex' in config_mail.cfg[_process] and config_mail.cfg[_process]['chronoregex']:
+        chrono_thread = FindChrono(ocr.field_text.get('chrono', ocr.text), config_mail.cfg[_process])
+    elif _process in config.cfg and 'chronoregex' in config.cfg[_process] and config.cfg[_process]['chronoregex']:
+        chrono_thread = FindChrono(ocr.field_text.get('chrono', ocr.text), config.cfg[_process])
+    else:
+        chrono_thread = ''
 
-        if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_subject') is True):
-            subject = subject_thread.subject
-        else:
-            subject = ''
+    # Find date of document
+    if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_date') is True:
+        date_thread = ''
+    else:
+        date_thread = FindDate(ocr.field_text.get('date', ocr.text), locale, log, config)
+
+    # Launch all threads
+    if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_date') is True):
+        date_thread.start()
+    if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_subject') is True):
+        subject_thread.start()
+    if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments']) and 'chronoregex' in config.cfg[_process] and config.cfg[_process]['chronoregex']:
+        chrono_thread.start()
+    elif args.get('isMail') is not None and args.get('isMail') in [True] and 'chronoregex' in config_mail.cfg[_process] and config_mail.cfg[_process]['chronoregex']:
+        chrono_thread.start()
+
+    # Wait for end of threads
+    if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_date') is True):
+        date_thread.join()
+    if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_subject') is True):
+        subject_thread.join()
+    if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments']) and 'chronoregex' in config.cfg[_process] and config.cfg[_process]['chronoregex']:
+        chrono_thread.join()
+    elif args.get('isMail') is not None and args.get('isMail') in [True] and 'chronoregex' in config_mail.cfg[_process] and config_mail.cfg[_process]['chronoregex']:
+        chrono_thread.join()
+
+    # Get the returned values
+    if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_date') is True):
+        date = date_thread.date
     else:
         date = ''
-        subject = ''
+
+    if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and 'chronoregex' not in config_mail.cfg[_process]:
+        chrono_number = ''
+    elif args.get('isMail') is not None and args.get('isMail') in [True] and 'chronoregex' in config_mail.cfg[_process] and config_mail.cfg[_process]['chronoregex']:
+        chrono_number = chrono_thread.chrono
+    elif _process in config.cfg and 'chronoregex' in config.cfg[_process] and config.cfg[_process]['chronoregex']:
+        chrono_number = chrono_thread.chrono
+    else:
         chrono_number = ''
-        contact = {}
 
+    if not (args.get('isMail') is not None and args.get('isMail') in [True, 'attachments'] and args.get('priority_mail_subject') is True):
+        subject = subject_thread.subject
+    else:
+        subject = ''
+
+    # Only the date and the subject are sure to be on a letter, most of them have no chrono number
+    missing = [field for field, thread, value in (('date', date_thread, date), ('subject', subject_thread, subject)) if thread != '' and not value]
+    if (ocr.field_text or ocr.tier == 'fast') and missing and image is not None and image.img is not None:
+        log.info('Nothing found into the ' + ('OCR zones' if ocr.field_text else 'fast OCR') + ' for ' + ', '.join(missing) + ', OCR of the full page')
+        ocr.field_text = {}
+        ocr_full_page(image, ocr, _process, 'fields', log)
+        full_date, full_subject, full_chrono_number = find_metadata(args, ocr, locale, log, config, config_mail, _process)
+        date, subject, chrono_number = date or full_date, subject or full_subject, chrono_number or full_chrono_number
+
+    return date, subject, chrono_number
+
+
+def make_searchable(args, file, is_ocr, image, ocr, tmp_folder, separator, log):
+    """
+    Create the searchable PDF (and PDF/A if needed) of the document
+
+    :return: Tuple with the path of the document (it changes if converted to PDF/A) and the content to send
+    """
     try:
         os.remove(image.jpg_name)  # Delete the temp file used to OCR'ed the first PDF page
     except FileNotFoundError:
         pass
 
     # Create the searchable PDF if necessary
-    if is_ocr is False:
-        log.info('Start OCR on document before send it')
+    if is_ocr is False and ocr.searchablePdf == '':  # Not already created with the OCR of the first page
+        log.info('Start OCR on document before send it' + (' (pages ' + ','.join(str(page) for page in ocr.pages) + ')' if ocr.pages else ''))
         ocr.generate_searchable_pdf(file, tmp_folder, separator)
-        file_to_send = ocr.searchablePdf
-    else:
+    file_to_send = ocr.searchablePdf if is_ocr is False else None
+    if not file_to_send:  # Already searchable, or the OCR failed : the document is sent as it is
         if separator.convert_to_pdfa == 'True' and os.path.splitext(file)[1].lower() == '.pdf' and (args.get('isMail') is None or args.get('isMail') is False):
             output_file = file.replace(separator.output_dir, separator.output_dir_pdfa)
             separator.convert_to_pdfa_function(output_file, file, log)
             file = output_file
         file_to_send = open(file, 'rb').read()
 
+    return file, file_to_send
+
+
+def send_document(args, file, file_to_send, date, subject, chrono_number, destination, log, config, config_mail, web_service):
+    """
+    Insert the document into MEM Courrier, then link it with the chrono number and reattach it if needed
+
+    :return: Tuple with a Boolean to show if the insertion is OK and the result of the WebServices, or False
+    """
+    _process = args['process_name']
+    contact = {}
     if args.get('isMail') is not None and args.get('isMail') in [True, 'attachments']:
         if date != '':
             args['data']['documentDate'] = date
@@ -273,3 +454,89 @@ def process(args, file, log, separator, config, image, ocr, locale, web_service,
     except shutil.Error as _e:
         log.error('Moving file ' + file + ' error : ' + str(_e))
     return False
+
+
+def process(args, file, log, separator, config, image, ocr, locale, web_service, tmp_folder, config_mail=None):
+    log.info('Processing file : ' + file)
+
+    # Check if the choosen process mode if available. If not take the default one
+    _process = args['process_name']
+    log.info('Using the following process : ' + _process)
+
+    destination = get_destination(args, file, separator, config, _process, log)
+
+    if args.get('isMail') is not None and args.get('isMail') is True:
+        if args['isForm']:
+            log.info('Start searching form into e-mail')
+            form = process_form(args, config, config_mail, log, web_service, _process, file)
+            if form and form[1] != 'default':
+                return form
+
+    is_ocr = read_document(file, image, ocr)
+
+    if is_lad_enabled(config, _process):
+        ocr_document(args, file, image, ocr, log, is_ocr, tmp_folder, separator)
+        date, subject, chrono_number = find_metadata(args, ocr, locale, log, config, config_mail, _process, image)
+    else:
+        date = ''
+        subject = ''
+        chrono_number = ''
+
+    file, file_to_send = make_searchable(args, file, is_ocr, image, ocr, tmp_folder, separator, log)
+    return send_document(args, file, file_to_send, date, subject, chrono_number, destination, log, config, config_mail, web_service)
+
+
+def read_pj(pj, image, ocr, locale, log, spans):
+    """
+    Read the text of an attachment (text layer, or OCR of its first page) and find its subject. Runs into the threads of process_pj,
+    with its own copies of the Images and PyTesseract instances (they keep the state of the current file)
+
+    :param spans: Class Document instance recording the spans of the document
+    :return: Subject of the attachment, or None
+    """
+    spansClass.set_current(spans)
+    image, ocr = copy.copy(image), copy.copy(ocr)
+    image.img = None
+    text = textLayerClass.usable_text(pj, int(image.config['GLOBAL'].get('textlayerminchars') or 50))
+    if text is None:
+        image.img = image.render_page(pj, 1)  # Unlike pdf_to_jpg, doesn't move the attachment to errorPath if it can't be rendered
+        if image.img is None:
+            return None
+        ocr.text_builder(preprocess_image(image, None, log))
+        text = ocr.text
+    subject_thread = FindSubject(text, locale, log)
+    subject_thread.run()  # Already into a thread of the pool
+    return subject_thread.subject
+
+
+def process_pj(file, res_id, separator, image, ocr, locale, web_service, log):
+    """
+    Insert the attachments (PJ) found by the separator for a document, as attachments of this document.
+    The attachments are read at the same time, and each one is inserted as soon as it and the previous ones are read,
+    so they are always inserted in the order of the separator
+
+    :param file: Path of the document created by the separator
+    :param res_id: resId of the document into MEM Courrier
+    """
+    document_filename = os.path.basename(file)
+    pjs = [pj for pj in separator.pj_list if re.sub(r"#\d", "", os.path.basename(pj).replace('PJ_', '')) == document_filename]
+    if not pjs:
+        return
+    workers = max(1, min(len(pjs), int(image.config['GLOBAL']['nbthreads'])))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pjThread') as executor:
+        futures = [executor.submit(read_pj, pj, image, ocr, locale, log, spansClass.current()) for pj in pjs]
+        for pj, future in zip(pjs, futures):
+            try:
+                subject = future.result()
+            except Exception as _e:
+                log.error('Error while reading the attachment ' + pj + ', inserted without subject : ' + str(_e))
+                subject = None
+            pj_args = {
+                'file': pj,
+                'format': 'pdf',
+                'status': 'A_TRA',
+                'subject': subject
+            }
+            res = web_service.insert_attachment_from_mail(pj_args, res_id)
+            if res:
+                log.info('Attachment inserted : ' + str(res))